@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+AP Gazette number normalization shared by the import scripts
+Institutions are keyed by ap_gazette_no, so every importer must turn the same cell into the same text
+"""
+
+import re
+
+import pandas as pd
+
+# Whole numbers that reached us as floats ("12345.0"): pandas infers float for a numeric
+# column with blank cells, and CSVs written from such frames keep the suffix
+_FLOAT_AP_PATTERN = r"^(\d+)\.0+$"
+_FLOAT_AP_RE = re.compile(_FLOAT_AP_PATTERN)
+
+def normalize_ap_no(value: str) -> str:
+    """AP Gazette No in its stored form ("12345.0" -> "12345"; anything else unchanged)"""
+    return _FLOAT_AP_RE.sub(r"\1", value)
+
+def normalize_ap_column(values: pd.Series) -> pd.Series:
+    """normalize_ap_no over a whole string column (<NA> stays <NA>)"""
+    return values.str.replace(_FLOAT_AP_PATTERN, r"\1", regex=True)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Shared Supabase credentials for the import scripts
+Loads the project .env once; variables already set in the environment win
+"""
+
+import os
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+ENV_FILE = Path(__file__).parent.parent / ".env"
+
+if ENV_FILE.exists():
+    if load_dotenv is not None:
+        load_dotenv(ENV_FILE, override=False)
+    else:
+        # Minimal KEY=value fallback when python-dotenv is not installed
+        with open(ENV_FILE, 'r') as f:
+            for key, sep, value in (line.strip().partition('=') for line in f):
+                if sep and key and not key.startswith('#'):
+                    os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("EXPO_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or
+                os.getenv("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SERVICE_ROLE_KEY"))
@@ -11,6 +11,7 @@ from pathlib import Path
 from typing import Optional, Dict, List, Any
 from decimal import Decimal, InvalidOperation
 from supabase import create_client, Client
+from _ap_numbers import normalize_ap_no
 
 # Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("EXPO_PUBLIC_SUPABASE_URL")
@@ -21,21 +22,14 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     env_file = Path(__file__).parent.parent / ".env"
     if env_file.exists():
         with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-
-                    if not SUPABASE_URL and (key == "SUPABASE_URL" or key == "EXPO_PUBLIC_SUPABASE_URL"):
-                        SUPABASE_URL = value
-                    if not SUPABASE_KEY and (key == "SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "SERVICE_ROLE_KEY"):
-                        SUPABASE_KEY = value
+            env = {
+                key.strip(): value.strip().strip('"').strip("'")
+                for key, sep, value in (line.strip().partition('=') for line in f)
+                if sep and key and not key.startswith('#')
+            }
+        SUPABASE_URL = SUPABASE_URL or env.get("SUPABASE_URL") or env.get("EXPO_PUBLIC_SUPABASE_URL")
+        SUPABASE_KEY = (SUPABASE_KEY or env.get("SUPABASE_SERVICE_ROLE_KEY") or
+                        env.get("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY") or env.get("SERVICE_ROLE_KEY"))
 
 if not SUPABASE_URL:
     print("[ERROR] SUPABASE_URL not found!")
@@ -78,6 +72,9 @@ CSV_TO_TABLE_MAP = {
     "YSR": "dcb_ysr_kadapa_district",
 }
 
+# Rows sent per upsert request
+BATCH_SIZE = 500
+
 def clean_numeric(value: Any) -> Optional[float]:
     """Convert value to numeric, handling empty strings, None, NaN, etc."""
     if value is None:
@@ -143,12 +140,20 @@ def calculate_balance_total(balance_arrears: Optional[float], balance_current: O
     total = arr + curr
     return total
 
-def process_csv_row(row: Dict[str, str], table_name: str) -> Dict[str, Any]:
-    """Process a single CSV row and return data ready for database insertion"""
+def process_csv_row(row: Dict[str, str], table_name: str) -> Optional[Dict[str, Any]]:
+    """Process a single CSV row and return data ready for database insertion.
 
-    # Text fields
+    Returns None if a required field is missing.
+    """
+
+    # Required fields - validate before parsing anything else
     ap_gazette_no = clean_text(row.get('ap_gazette_no', ''))
     institution_name = clean_text(row.get('institution_name', ''))
+    if not ap_gazette_no or not institution_name:
+        return None
+    ap_gazette_no = normalize_ap_no(ap_gazette_no)
+
+    # Text fields
     village = clean_text(row.get('village', ''))
     mandal = clean_text(row.get('mandal', ''))
     remarks = clean_text(row.get('remarks', ''))
@@ -207,10 +212,7 @@ def process_csv_row(row: Dict[str, str], table_name: str) -> Dict[str, Any]:
     else:
         balance_total = balance_total_raw
 
-    # Validate required fields
-    if not ap_gazette_no or not institution_name:
-        raise ValueError(f"Missing required fields: ap_gazette_no={ap_gazette_no}, institution_name={institution_name}")
-
+    # Keep this a literal: CPython already builds it from one constant key tuple
     return {
         'ap_gazette_no': ap_gazette_no,
         'institution_name': institution_name,
@@ -233,6 +235,26 @@ def process_csv_row(row: Dict[str, str], table_name: str) -> Dict[str, Any]:
         'remarks': remarks,
     }
 
+def flush_batch(rows: List[Dict[str, Any]], table_name: str, stats: Dict[str, int], dry_run: bool) -> None:
+    """Upsert a batch of processed rows in a single request"""
+    if dry_run:
+        # Dry run - just validate
+        stats['imported'] += len(rows)
+        return
+
+    try:
+        # Use upsert based on ap_gazette_no
+        supabase.table(table_name).upsert(rows, on_conflict='ap_gazette_no').execute()
+
+        # Supabase doesn't tell us insert vs update, so we'll assume update if no error
+        stats['updated'] += len(rows)
+        stats['imported'] += len(rows)
+    except Exception as e:
+        print(f"  [ERROR] Batch of {len(rows)} rows: {e}")
+        stats['errors'] += len(rows)
+        import traceback
+        traceback.print_exc()
+
 def import_csv_file(csv_path: Path, table_name: str, dry_run: bool = False) -> Dict[str, int]:
     """Import a single CSV file to the specified table"""
     stats = {
@@ -248,32 +270,25 @@ def import_csv_file(csv_path: Path, table_name: str, dry_run: bool = False) -> D
     try:
         with open(csv_path, 'r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
-            rows_to_insert = []
+            # Keyed by ap_gazette_no across the whole file so duplicates collapse (last
+            # occurrence wins) even when they are further apart than one batch
+            rows_to_insert: Dict[str, Dict[str, Any]] = {}
+            duplicates = 0
 
             for row_num, row in enumerate(reader, start=2):  # Start at 2 (header is row 1)
                 stats['total_rows'] += 1
 
                 try:
                     data = process_csv_row(row, table_name)
+                    if data is None:
+                        print(f"  [WARN] Row {row_num}: Missing required fields: ap_gazette_no / institution_name")
+                        stats['skipped'] += 1
+                        continue
+
+                    if data['ap_gazette_no'] in rows_to_insert:
+                        duplicates += 1
+                    rows_to_insert[data['ap_gazette_no']] = data
 
-                    if not dry_run:
-                        # Use upsert based on ap_gazette_no
-                        result = supabase.table(table_name).upsert(
-                            data,
-                            on_conflict='ap_gazette_no'
-                        ).execute()
-
-                        # Check if it was an insert or update
-                        # (Supabase doesn't directly tell us, so we'll assume update if no error)
-                        stats['updated'] += 1
-                        stats['imported'] += 1
-                    else:
-                        # Dry run - just validate
-                        stats['imported'] += 1
-
-                except ValueError as e:
-                    print(f"  [WARN] Row {row_num}: {e}")
-                    stats['skipped'] += 1
                 except Exception as e:
                     print(f"  [ERROR] Row {row_num}: {e}")
                     stats['errors'] += 1
@@ -281,6 +296,15 @@ def import_csv_file(csv_path: Path, table_name: str, dry_run: bool = False) -> D
                         import traceback
                         traceback.print_exc()
 
+            # District files are small; send the collapsed rows in BATCH_SIZE requests
+            pending = list(rows_to_insert.values())
+            for start in range(0, len(pending), BATCH_SIZE):
+                flush_batch(pending[start:start + BATCH_SIZE], table_name, stats, dry_run)
+
+            if duplicates:
+                print(f"  [WARN] {duplicates} duplicate ap_gazette_no rows collapsed (last occurrence kept)")
+                stats['skipped'] += duplicates
+
         print(f"  [OK] Processed {stats['total_rows']} rows")
         print(f"       - Imported/Updated: {stats['imported']}")
         print(f"       - Skipped: {stats['skipped']}")
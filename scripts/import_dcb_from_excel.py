@@ -6,14 +6,24 @@ Handles nested column headers (e.g., Extent Ac0Cents with Dry/Wet sub-columns)
 """
 
 import pandas as pd
+import openpyxl
 import sys
 import os
 from pathlib import Path
-import re
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import argparse
 from supabase import create_client, Client
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from _ap_numbers import normalize_ap_column
+
+# Rust-based calamine reader is much faster than openpyxl; fall back if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 
 # Configuration
 EXCEL_DIR = Path(__file__).parent.parent / "assets" / "Waqf Data"
@@ -25,21 +35,14 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     env_file = Path(__file__).parent.parent / ".env"
     if env_file.exists():
         with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-
-                    if not SUPABASE_URL and (key == "SUPABASE_URL" or key == "EXPO_PUBLIC_SUPABASE_URL"):
-                        SUPABASE_URL = value
-                    if not SUPABASE_KEY and (key == "SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "SERVICE_ROLE_KEY"):
-                        SUPABASE_KEY = value
+            env = {
+                key.strip(): value.strip().strip('"').strip("'")
+                for key, sep, value in (line.strip().partition('=') for line in f)
+                if sep and key and not key.startswith('#')
+            }
+        SUPABASE_URL = SUPABASE_URL or env.get("SUPABASE_URL") or env.get("EXPO_PUBLIC_SUPABASE_URL")
+        SUPABASE_KEY = (SUPABASE_KEY or env.get("SUPABASE_SERVICE_ROLE_KEY") or
+                        env.get("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY") or env.get("SERVICE_ROLE_KEY"))
 
 if not SUPABASE_URL:
     print("[ERROR] SUPABASE_URL not found!")
@@ -83,8 +86,25 @@ DISTRICT_MAPPING = {
     "YSR": "YSR Kadapa District",
 }
 
+# Case-insensitive lookup by Excel file stem
+_DISTRICT_MAPPING_LOWER = {k.lower(): v for k, v in DISTRICT_MAPPING.items()}
+
 DEFAULT_FINANCIAL_YEAR = os.getenv("FINANCIAL_YEAR") or "2025-26"
 
+# Repeated header rows inside the sheet body
+SKIP_AP_PATTERNS = frozenset({"ap no", "ap gazette no", "gazette", "sl no", "s.no", "serial no", "sno", "serial number"})
+SKIP_NAME_PATTERNS = frozenset({"institution name", "name of institution", "name", "waqf name"})
+
+# PostgREST caps each response (1000 rows by default), so bulk reads are paged
+PAGE_SIZE = 1000
+
+# Rows sent per institution_dcb upsert request
+UPSERT_BATCH_SIZE = 500
+
+# Files larger than this are streamed CHUNK_ROWS rows at a time instead of read whole
+LARGE_FILE_BYTES = 20 * 1024 * 1024
+CHUNK_ROWS = 5000
+
 def _parse_only_list(value: Optional[str]) -> List[str]:
     if not value:
         return []
@@ -106,65 +126,18 @@ def clean_numeric(value) -> float:
     try:
         if isinstance(value, str):
             value = value.replace(",", "").replace("₹", "").strip()
-            # Handle scientific notation
-            if 'e+' in value.lower() or 'e-' in value.lower():
-                return float(value)
-        num = float(value)
-        return num
+        # float() parses scientific notation directly
+        return float(value)
     except (ValueError, TypeError):
         return 0.0
 
-def parse_date(date_str) -> Optional[str]:
-    """Parse date string to YYYY-MM-DD format"""
-    if pd.isna(date_str) or not date_str:
-        return None
-    date_str = str(date_str).strip()
-    if date_str.lower() in ["-", "", "nan", "none"]:
-        return None
-    try:
-        # Try parsing as date
-        if isinstance(date_str, pd.Timestamp):
-            return date_str.strftime('%Y-%m-%d')
-        # Try common date formats
-        for fmt in ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y/%m/%d', '%d-%b-%Y', '%d/%b/%Y']:
-            try:
-                return pd.to_datetime(date_str, format=fmt).strftime('%Y-%m-%d')
-            except:
-                continue
-        # Last resort: pandas auto-parse
-        return pd.to_datetime(date_str).strftime('%Y-%m-%d')
-    except:
-        return None
-
-def extract_receipt_challan(combined_value: str) -> Tuple[Optional[str], Optional[str]]:
-    """Extract receipt/challan number and date from combined string"""
-    if not combined_value or pd.isna(combined_value):
-        return None, None
-
-    combined = str(combined_value).strip()
-    if combined.lower() in ["-", "", "nan", "none"]:
-        return None, None
-
-    # Try to extract number and date
-    # Common patterns: "12345 01-01-2024" or "12345/01-01-2024" or "12345, 01-01-2024"
-    parts = re.split(r'[,\s/]+', combined)
-    receipt_no = None
-    receipt_date = None
-
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        # Check if it looks like a date
-        date_parsed = parse_date(part)
-        if date_parsed:
-            receipt_date = date_parsed
-        # Otherwise assume it's the receipt number
-        elif not receipt_no and len(part) > 0:
-            receipt_no = part
-
-    return receipt_no, receipt_date
+def vclean_numeric(series: pd.Series) -> pd.Series:
+    """Vectorized clean_numeric for a whole column (commas, ₹, blanks -> 0.0)"""
+    text = series.astype("string").str.replace(",", "", regex=False).str.replace("₹", "", regex=False).str.strip()
+    # float64 even for all-integer columns: numpy ints are not JSON serializable
+    return pd.to_numeric(text, errors="coerce").fillna(0.0).astype(float)
 
+@lru_cache(maxsize=None)
 def get_district_id(district_name: str) -> Optional[str]:
     """Get district UUID from database"""
     try:
@@ -176,6 +149,7 @@ def get_district_id(district_name: str) -> Optional[str]:
         print(f"  [ERROR] Failed to get district ID for {district_name}: {e}")
         return None
 
+@lru_cache(maxsize=None)
 def get_inspector_id(district_id: str) -> Optional[str]:
     """Get inspector UUID for a district"""
     try:
@@ -187,31 +161,81 @@ def get_inspector_id(district_id: str) -> Optional[str]:
         print(f"  [ERROR] Failed to get inspector ID for district {district_id}: {e}")
         return None
 
-def get_institution_id(ap_gazette_no: str) -> Optional[str]:
-    """Get institution UUID by AP Gazette No"""
+def fetch_all_rows(table: str, columns: str, filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Fetch every matching row of a table, one page at a time"""
+    rows = []
+    offset = 0
+    while True:
+        query = supabase.table(table).select(columns)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        page = query.range(offset, offset + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+def load_institution_ids() -> Dict[str, str]:
+    """Map AP Gazette No -> institution UUID for all institutions"""
+    rows = fetch_all_rows("institutions", "id, ap_gazette_no")
+    return {r["ap_gazette_no"]: r["id"] for r in rows}
+
+def load_existing_dcb_institutions(financial_year: str) -> Set[str]:
+    """Institution UUIDs that already have a DCB record for one financial year"""
+    rows = fetch_all_rows("institution_dcb", "institution_id", {"financial_year": financial_year})
+    return {r["institution_id"] for r in rows}
+
+def iter_data_chunks(excel_file: Path, skiprows: int, usecols: List[int]) -> Iterator[pd.DataFrame]:
+    """Yield the first sheet's data rows, columns labelled by sheet position.
+
+    Normal files are read in one go; files over LARGE_FILE_BYTES are streamed with
+    openpyxl in read-only mode, CHUNK_ROWS rows at a time, so memory stays bounded.
+    """
+    if excel_file.stat().st_size <= LARGE_FILE_BYTES:
+        yield pd.read_excel(excel_file, header=None, skiprows=skiprows, usecols=usecols, engine=EXCEL_ENGINE)
+        return
+
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
     try:
-        response = supabase.table("institutions").select("id").eq("ap_gazette_no", ap_gazette_no).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]["id"]
-        return None
-    except Exception as e:
-        return None
-
-def find_column_index(df: pd.DataFrame, search_terms: List[str], exclude_terms: List[str] = None) -> Optional[int]:
-    """Find column index by searching for terms in column names (handles multi-level headers)"""
-    exclude_terms = exclude_terms or []
-
-    for idx, col in enumerate(df.columns):
-        # Handle multi-level columns (tuples)
-        if isinstance(col, tuple):
-            col_str = " ".join(str(c).lower() for c in col if pd.notna(c))
-        else:
-            col_str = str(col).lower().strip()
-
-        # Check if all search terms are present and no exclude terms
-        if all(term.lower() in col_str for term in search_terms):
-            if not any(exclude.lower() in col_str for exclude in exclude_terms):
-                return idx
+        rows = []
+        start = 0
+        for values in wb.worksheets[0].iter_rows(min_row=skiprows + 1, values_only=True):
+            rows.append([values[c] if c < len(values) else None for c in usecols])
+            if len(rows) >= CHUNK_ROWS:
+                yield pd.DataFrame(rows, columns=usecols, index=range(start, start + len(rows)))
+                start += len(rows)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=usecols, index=range(start, start + len(rows)))
+    finally:
+        wb.close()
+
+def upsert_dcb_batch(rows: List[Dict]) -> List[Dict]:
+    """Insert or update a batch of DCB rows in one request"""
+    result = (
+        supabase.table("institution_dcb")
+        .upsert(rows, on_conflict="institution_id,financial_year")
+        .execute()
+    )
+    return result.data or []
+
+def flatten_headers(df: pd.DataFrame) -> List[str]:
+    """Lowercased header string per column (multi-level headers joined with spaces)"""
+    return [
+        " ".join(str(c).lower() for c in col if pd.notna(c)) if isinstance(col, tuple) else str(col).lower().strip()
+        for col in df.columns
+    ]
+
+def find_column_index(headers: List[str], *candidates: Tuple[List[str], List[str]]) -> Optional[int]:
+    """Find column index for the first (search_terms, exclude_terms) candidate that matches a header"""
+    for search_terms, exclude_terms in candidates:
+        search_terms = [term.lower() for term in search_terms]
+        exclude_terms = [exclude.lower() for exclude in exclude_terms]
+        for idx, col_str in enumerate(headers):
+            # Check if all search terms are present and no exclude terms
+            if all(term in col_str for term in search_terms):
+                if not any(exclude in col_str for exclude in exclude_terms):
+                    return idx
 
     return None
 
@@ -221,9 +245,13 @@ def flatten_column_name(col) -> str:
         return " ".join(str(c) for c in col if pd.notna(c))
     return str(col)
 
-def process_excel_file(excel_file: Path, financial_year: str) -> Dict:
-    """Process a single Excel file and return statistics"""
-    district_name = DISTRICT_MAPPING.get(excel_file.stem)
+def process_excel_file(excel_file: Path, financial_year: str,
+                       institution_ids: Dict[str, str], existing_dcb: Set[str]) -> Dict:
+    """Process a single Excel file and return statistics.
+
+    institution_ids and existing_dcb are the preloaded lookups shared by all files.
+    """
+    district_name = _DISTRICT_MAPPING_LOWER.get(excel_file.stem.lower())
     if not district_name:
         print(f"\n[SKIP] {excel_file.name} - District name not found in mapping")
         return {"status": "skipped", "reason": "district_not_found"}
@@ -244,218 +272,204 @@ def process_excel_file(excel_file: Path, financial_year: str) -> Dict:
         return {"status": "error", "error": f"No inspector for district: {district_name}"}
 
     try:
-        # Try reading with multi-level headers first (header=[0, 1])
-        # If that fails, try single-level header
-        df = None
+        # First pass reads only the header rows, to locate the columns we need.
+        # Try multi-level headers first (header=[0, 1]); if that fails, try single-level header
+        header_df = None
         try:
-            df = pd.read_excel(excel_file, header=[0, 1])
+            header_df = pd.read_excel(excel_file, header=[0, 1], nrows=0, engine=EXCEL_ENGINE)
             print(f"  [INFO] Read Excel with multi-level headers")
         except:
             try:
-                df = pd.read_excel(excel_file, header=0)
+                header_df = pd.read_excel(excel_file, header=0, nrows=0, engine=EXCEL_ENGINE)
                 print(f"  [INFO] Read Excel with single-level header")
             except Exception as e:
                 print(f"  [ERROR] Failed to read Excel file: {e}")
                 return {"status": "error", "error": str(e)}
 
-        print(f"  [INFO] Found {len(df)} rows in Excel file")
-        print(f"  [INFO] Total columns: {len(df.columns)}")
+        print(f"  [INFO] Total columns: {len(header_df.columns)}")
 
         # Print first few column names for debugging
-        print(f"  [INFO] First 10 columns: {[flatten_column_name(c) for c in df.columns[:10]]}")
+        print(f"  [INFO] First 10 columns: {[flatten_column_name(c) for c in header_df.columns[:10]]}")
 
-        # Find columns using flexible search
-        ap_no_col = find_column_index(df, ["ap", "gazette"], ["sl no", "serial"])
-        if ap_no_col is None:
-            ap_no_col = find_column_index(df, ["gazette"], [])
-        if ap_no_col is None:
-            ap_no_col = find_column_index(df, ["sl", "no"], [])
+        # Find columns using flexible search (fallbacks tried in order)
+        headers = flatten_headers(header_df)
 
-        name_col = find_column_index(df, ["institution", "name"], ["mandal", "village", "of officer"])
-        if name_col is None:
-            name_col = find_column_index(df, ["name"], ["mandal", "village"])
+        ap_no_col = find_column_index(headers, (["ap", "gazette"], ["sl no", "serial"]), (["gazette"], []), (["sl", "no"], []))
+        name_col = find_column_index(headers, (["institution", "name"], ["mandal", "village", "of officer"]), (["name"], ["mandal", "village"]))
 
-        mandal_col = find_column_index(df, ["mandal"], [])
-        village_col = find_column_index(df, ["village"], [])
+        mandal_col = find_column_index(headers, (["mandal"], []))
+        village_col = find_column_index(headers, (["village"], []))
 
         # Extent columns (under "Extent Ac0Cents")
-        ext_dry_col = find_column_index(df, ["extent", "dry"], ["total", "wet"])
-        if ext_dry_col is None:
-            ext_dry_col = find_column_index(df, ["dry"], ["total"])
-
-        ext_wet_col = find_column_index(df, ["extent", "wet"], ["total", "dry"])
-        if ext_wet_col is None:
-            ext_wet_col = find_column_index(df, ["wet"], ["total"])
+        ext_dry_col = find_column_index(headers, (["extent", "dry"], ["total", "wet"]), (["dry"], ["total"]))
+        ext_wet_col = find_column_index(headers, (["extent", "wet"], ["total", "dry"]), (["wet"], ["total"]))
 
         # Demand columns (under "Demand (in Rs)")
-        d_arrears_col = find_column_index(df, ["demand", "arrear"], ["total", "current"])
-        if d_arrears_col is None:
-            d_arrears_col = find_column_index(df, ["arrear"], ["total", "current", "collection", "balance"])
-
-        d_current_col = find_column_index(df, ["demand", "current"], ["total", "arrear"])
-        if d_current_col is None:
-            d_current_col = find_column_index(df, ["current"], ["total", "arrear", "collection", "balance"])
+        d_arrears_col = find_column_index(headers, (["demand", "arrear"], ["total", "current"]),
+                                          (["arrear"], ["total", "current", "collection", "balance"]))
+        d_current_col = find_column_index(headers, (["demand", "current"], ["total", "arrear"]),
+                                          (["current"], ["total", "arrear", "collection", "balance"]))
 
         # Collection columns (under "Collection (in Rs)")
-        c_arrears_col = find_column_index(df, ["collection", "arrear"], ["total", "current"])
-        if c_arrears_col is None:
-            c_arrears_col = find_column_index(df, ["arrear"], ["total", "current", "demand", "balance"])
-
-        c_current_col = find_column_index(df, ["collection", "current"], ["total", "arrear"])
-        if c_current_col is None:
-            c_current_col = find_column_index(df, ["current"], ["total", "arrear", "demand", "balance"])
+        c_arrears_col = find_column_index(headers, (["collection", "arrear"], ["total", "current"]),
+                                          (["arrear"], ["total", "current", "demand", "balance"]))
+        c_current_col = find_column_index(headers, (["collection", "current"], ["total", "arrear"]),
+                                          (["current"], ["total", "arrear", "demand", "balance"]))
 
         # Receipt and Challan (under "Collection (in Rs)")
-        receipt_col = find_column_index(df, ["receipt"], ["challan"])
-        challan_col = find_column_index(df, ["challan"], ["receipt"])
+        receipt_col = find_column_index(headers, (["receipt"], ["challan"]))
+        challan_col = find_column_index(headers, (["challan"], ["receipt"]))
 
-        remarks_col = find_column_index(df, ["remark"], [])
+        remarks_col = find_column_index(headers, (["remark"], []))
 
         # Print detected column mapping
         print(f"\n  [INFO] Column mapping detected:")
-        print(f"    AP Gazette No: Column {ap_no_col} ({flatten_column_name(df.columns[ap_no_col]) if ap_no_col is not None else 'NOT FOUND'})")
-        print(f"    Institution Name: Column {name_col} ({flatten_column_name(df.columns[name_col]) if name_col is not None else 'NOT FOUND'})")
-        print(f"    Mandal: Column {mandal_col} ({flatten_column_name(df.columns[mandal_col]) if mandal_col is not None else 'NOT FOUND'})")
-        print(f"    Village: Column {village_col} ({flatten_column_name(df.columns[village_col]) if village_col is not None else 'NOT FOUND'})")
-        print(f"    Extent Dry: Column {ext_dry_col} ({flatten_column_name(df.columns[ext_dry_col]) if ext_dry_col is not None else 'NOT FOUND'})")
-        print(f"    Extent Wet: Column {ext_wet_col} ({flatten_column_name(df.columns[ext_wet_col]) if ext_wet_col is not None else 'NOT FOUND'})")
-        print(f"    Demand Arrears: Column {d_arrears_col} ({flatten_column_name(df.columns[d_arrears_col]) if d_arrears_col is not None else 'NOT FOUND'})")
-        print(f"    Demand Current: Column {d_current_col} ({flatten_column_name(df.columns[d_current_col]) if d_current_col is not None else 'NOT FOUND'})")
-        print(f"    Collection Arrears: Column {c_arrears_col} ({flatten_column_name(df.columns[c_arrears_col]) if c_arrears_col is not None else 'NOT FOUND'})")
-        print(f"    Collection Current: Column {c_current_col} ({flatten_column_name(df.columns[c_current_col]) if c_current_col is not None else 'NOT FOUND'})")
-        print(f"    Receipt: Column {receipt_col} ({flatten_column_name(df.columns[receipt_col]) if receipt_col is not None else 'NOT FOUND'})")
-        print(f"    Challan: Column {challan_col} ({flatten_column_name(df.columns[challan_col]) if challan_col is not None else 'NOT FOUND'})")
-        print(f"    Remarks: Column {remarks_col} ({flatten_column_name(df.columns[remarks_col]) if remarks_col is not None else 'NOT FOUND'})")
+        print(f"    AP Gazette No: Column {ap_no_col} ({flatten_column_name(header_df.columns[ap_no_col]) if ap_no_col is not None else 'NOT FOUND'})")
+        print(f"    Institution Name: Column {name_col} ({flatten_column_name(header_df.columns[name_col]) if name_col is not None else 'NOT FOUND'})")
+        print(f"    Mandal: Column {mandal_col} ({flatten_column_name(header_df.columns[mandal_col]) if mandal_col is not None else 'NOT FOUND'})")
+        print(f"    Village: Column {village_col} ({flatten_column_name(header_df.columns[village_col]) if village_col is not None else 'NOT FOUND'})")
+        print(f"    Extent Dry: Column {ext_dry_col} ({flatten_column_name(header_df.columns[ext_dry_col]) if ext_dry_col is not None else 'NOT FOUND'})")
+        print(f"    Extent Wet: Column {ext_wet_col} ({flatten_column_name(header_df.columns[ext_wet_col]) if ext_wet_col is not None else 'NOT FOUND'})")
+        print(f"    Demand Arrears: Column {d_arrears_col} ({flatten_column_name(header_df.columns[d_arrears_col]) if d_arrears_col is not None else 'NOT FOUND'})")
+        print(f"    Demand Current: Column {d_current_col} ({flatten_column_name(header_df.columns[d_current_col]) if d_current_col is not None else 'NOT FOUND'})")
+        print(f"    Collection Arrears: Column {c_arrears_col} ({flatten_column_name(header_df.columns[c_arrears_col]) if c_arrears_col is not None else 'NOT FOUND'})")
+        print(f"    Collection Current: Column {c_current_col} ({flatten_column_name(header_df.columns[c_current_col]) if c_current_col is not None else 'NOT FOUND'})")
+        print(f"    Receipt: Column {receipt_col} ({flatten_column_name(header_df.columns[receipt_col]) if receipt_col is not None else 'NOT FOUND'})")
+        print(f"    Challan: Column {challan_col} ({flatten_column_name(header_df.columns[challan_col]) if challan_col is not None else 'NOT FOUND'})")
+        print(f"    Remarks: Column {remarks_col} ({flatten_column_name(header_df.columns[remarks_col]) if remarks_col is not None else 'NOT FOUND'})")
 
         # Validate critical columns
         if ap_no_col is None or name_col is None:
             print(f"  [ERROR] Critical columns (AP Gazette No or Institution Name) not found!")
             return {"status": "error", "error": "Critical columns not found"}
 
+        # Second pass loads only the columns we use. usecols can't be combined with a
+        # multi-level header, so skip the header rows instead; column labels stay the
+        # original positions found above.
+        used_cols = sorted({
+            c for c in [ap_no_col, name_col, ext_dry_col, ext_wet_col, d_arrears_col,
+                        d_current_col, c_arrears_col, c_current_col, remarks_col]
+            if c is not None
+        })
+
         dcb_records_created = 0
         dcb_records_updated = 0
         rows_processed = 0
         rows_skipped = 0
         errors = []
 
-        for idx, row in df.iterrows():
-            rows_processed += 1
-            try:
-                # Extract AP No and Institution Name
-                ap_no = None
-                institution_name = None
+        # Keyed by institution_id: a repeated AP No overwrites the earlier row (last wins)
+        pending: Dict[str, Dict] = {}
 
+        def flush_pending():
+            nonlocal dcb_records_created, dcb_records_updated
+            if not pending:
+                return
+            batch = list(pending.values())
+            pending.clear()
+            try:
+                upsert_dcb_batch(batch)
+            except Exception as e:
+                errors.append(f"Batch of {len(batch)} DCB rows: {str(e)}")
+                print(f"  [ERROR] Failed to upsert batch of {len(batch)} DCB rows: {e}")
+                return
+            for record in batch:
+                if record["institution_id"] in existing_dcb:
+                    dcb_records_updated += 1
+                else:
+                    existing_dcb.add(record["institution_id"])
+                    dcb_records_created += 1
+
+        # Clean every needed column in one vectorized pass instead of per cell
+        def text_column(df, col_idx, ap_key=False):
+            if col_idx is None:
+                return pd.Series(None, index=df.index, dtype=object)
+            text = df[col_idx].astype("string").str.strip()
+            if ap_key:
+                # Same key as the other importers: a numeric AP column with blanks reads as float
+                text = normalize_ap_column(text)
+            text = text.mask(text.str.lower().isin(["nan", "none", "", "-", "n/a", "na"]))
+            return text.astype(object).where(text.notna(), None)
+
+        def numeric_column(df, col_idx):
+            if col_idx is None:
+                return pd.Series(0.0, index=df.index)
+            return vclean_numeric(df[col_idx])
+
+        # Note: receipt_no, receipt_date, challan_no, challan_date are not stored in institution_dcb
+        # They would be in collections table if needed
+
+        for df in iter_data_chunks(excel_file, header_df.columns.nlevels, used_cols):
+            work = pd.DataFrame({
+                "row_num": df.index + 2,
+                "ap_no": text_column(df, ap_no_col, ap_key=True),
+                "institution_name": text_column(df, name_col),
+                "ext_dry": numeric_column(df, ext_dry_col),
+                "ext_wet": numeric_column(df, ext_wet_col),
+                "d_arrears": numeric_column(df, d_arrears_col),
+                "d_current": numeric_column(df, d_current_col),
+                "c_arrears": numeric_column(df, c_arrears_col),
+                "c_current": numeric_column(df, c_current_col),
+                "remarks": text_column(df, remarks_col),
+            })
+
+            # Drop blank, repeated-header and serial-number rows in one shot
+            ap_lower = work["ap_no"].str.lower()
+            name_lower = work["institution_name"].str.lower()
+            keep = (
+                work["ap_no"].notna()
+                & work["institution_name"].notna()
+                & ~ap_lower.isin(SKIP_AP_PATTERNS)
+                & ~name_lower.isin(SKIP_NAME_PATTERNS)
+                # AP No that is just a small number is likely a row number
+                & ~work["ap_no"].str.fullmatch(r"\d{1,3}", na=False).astype(bool)
+            )
+            rows_processed += len(work)
+            rows_skipped += int((~keep).sum())
+            work = work[keep]
+
+            for row in work.itertuples(index=False, name=None):
+                row_num, ap_no, _, ext_dry, ext_wet, d_arrears, d_current, c_arrears, c_current, remarks = row
                 try:
-                    if ap_no_col is not None:
-                        ap_no = clean_text(row.iloc[ap_no_col])
-                    if name_col is not None:
-                        institution_name = clean_text(row.iloc[name_col])
-                except (IndexError, KeyError):
+                    # Get institution ID
+                    institution_id = institution_ids.get(ap_no)
+                    if not institution_id:
+                        # Institution doesn't exist, skip DCB record
+                        rows_skipped += 1
+                        continue
+
+                    # Prepare DCB data
+                    # Note: Totals (extent_total, demand_total, collection_total, balance_*) are GENERATED columns
+                    # in the database, so we don't need to calculate them here
+                    dcb_data = {
+                        "institution_id": institution_id,
+                        "inspector_id": inspector_id,
+                        "extent_dry": ext_dry,
+                        "extent_wet": ext_wet,
+                        # extent_total will be auto-calculated: extent_dry + extent_wet
+                        "demand_arrears": d_arrears,
+                        "demand_current": d_current,
+                        # demand_total will be auto-calculated: demand_arrears + demand_current
+                        "collection_arrears": c_arrears,
+                        "collection_current": c_current,
+                        # collection_total will be auto-calculated: collection_arrears + collection_current
+                        # balance_arrears, balance_current, balance_total will be auto-calculated
+                        "remarks": remarks,
+                        "financial_year": financial_year,
+                    }
+
+                    pending[institution_id] = dcb_data
+                    if len(pending) >= UPSERT_BATCH_SIZE:
+                        flush_pending()
+
+                except Exception as e:
+                    error_msg = f"Row {row_num}: {str(e)}"
+                    errors.append(error_msg)
                     rows_skipped += 1
-                    continue
+                    if len(errors) <= 5:
+                        print(f"  [ERROR] {error_msg}")
 
-                # Skip if missing required fields
-                if not ap_no or not institution_name:
-                    rows_skipped += 1
-                    continue
-
-                # Skip header rows
-                ap_no_lower = str(ap_no).lower() if ap_no else ""
-                name_lower = str(institution_name).lower() if institution_name else ""
-
-                skip_patterns = ["ap no", "ap gazette no", "gazette", "sl no", "s.no", "serial no", "sno", "serial number"]
-                if ap_no_lower in skip_patterns or name_lower in ["institution name", "name of institution", "name", "waqf name"]:
-                    rows_skipped += 1
-                    continue
-
-                # Skip if AP No is just a small number (likely row number)
-                if ap_no.isdigit() and len(ap_no) <= 3:
-                    rows_skipped += 1
-                    continue
-
-                # Get institution ID
-                institution_id = get_institution_id(ap_no)
-                if not institution_id:
-                    # Institution doesn't exist, skip DCB record
-                    rows_skipped += 1
-                    continue
-
-                # Extract all DCB fields with safe indexing
-                def safe_get(col_idx, default=0.0, is_numeric=True):
-                    if col_idx is None:
-                        return default
-                    try:
-                        if col_idx < len(row):
-                            value = row.iloc[col_idx]
-                            return clean_numeric(value) if is_numeric else clean_text(value)
-                    except (IndexError, KeyError):
-                        pass
-                    return default
-
-                ext_dry = safe_get(ext_dry_col, 0.0, True)
-                ext_wet = safe_get(ext_wet_col, 0.0, True)
-                d_arrears = safe_get(d_arrears_col, 0.0, True)
-                d_current = safe_get(d_current_col, 0.0, True)
-                c_arrears = safe_get(c_arrears_col, 0.0, True)
-                c_current = safe_get(c_current_col, 0.0, True)
-                remarks = safe_get(remarks_col, None, False)
-
-                receipt_str = safe_get(receipt_col, None, False)
-                challan_str = safe_get(challan_col, None, False)
-
-                # Note: receipt_no, receipt_date, challan_no, challan_date are not stored in institution_dcb
-                # They would be in collections table if needed
-
-                # Prepare DCB data
-                # Note: Totals (extent_total, demand_total, collection_total, balance_*) are GENERATED columns
-                # in the database, so we don't need to calculate them here
-                dcb_data = {
-                    "institution_id": institution_id,
-                    "inspector_id": inspector_id,
-                    "extent_dry": ext_dry,
-                    "extent_wet": ext_wet,
-                    # extent_total will be auto-calculated: extent_dry + extent_wet
-                    "demand_arrears": d_arrears,
-                    "demand_current": d_current,
-                    # demand_total will be auto-calculated: demand_arrears + demand_current
-                    "collection_arrears": c_arrears,
-                    "collection_current": c_current,
-                    # collection_total will be auto-calculated: collection_arrears + collection_current
-                    # balance_arrears, balance_current, balance_total will be auto-calculated
-                    "remarks": remarks,
-                    "financial_year": financial_year,
-                }
-
-                # Check if DCB record exists
-                existing = (
-                    supabase.table("institution_dcb")
-                    .select("id")
-                    .eq("institution_id", institution_id)
-                    .eq("financial_year", financial_year)
-                    .execute()
-                )
-
-                if existing.data and len(existing.data) > 0:
-                    # Update existing
-                    result = supabase.table("institution_dcb").update(dcb_data).eq("id", existing.data[0]["id"]).execute()
-                    if result.data:
-                        dcb_records_updated += 1
-                    else:
-                        errors.append(f"Row {idx + 2}: Failed to update DCB for {ap_no}")
-                else:
-                    # Create new
-                    result = supabase.table("institution_dcb").insert(dcb_data).execute()
-                    if result.data:
-                        dcb_records_created += 1
-                    else:
-                        errors.append(f"Row {idx + 2}: Failed to insert DCB for {ap_no}")
-
-            except Exception as e:
-                error_msg = f"Row {idx + 2}: {str(e)}"
-                errors.append(error_msg)
-                rows_skipped += 1
-                if len(errors) <= 5:
-                    print(f"  [ERROR] {error_msg}")
+        flush_pending()
 
         print(f"\n  [SUMMARY] {district_name}:")
         print(f"    Rows Processed: {rows_processed}")
@@ -497,6 +511,12 @@ def main():
         help=f"Financial year to import into (default: {DEFAULT_FINANCIAL_YEAR})",
         default=DEFAULT_FINANCIAL_YEAR,
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of Excel files to process concurrently (default: 8, use 1 for ordered output)",
+        default=8,
+    )
     args = parser.parse_args()
     only = _parse_only_list(args.only)
     financial_year = str(args.year).strip() or DEFAULT_FINANCIAL_YEAR
@@ -520,7 +540,7 @@ def main():
         filtered_files = []
         for f in excel_files:
             stem = f.stem.lower()
-            mapped = (DISTRICT_MAPPING.get(f.stem) or "").lower()
+            mapped = (_DISTRICT_MAPPING_LOWER.get(stem) or "").lower()
             if stem in allowed or mapped in allowed:
                 filtered_files.append(f)
         excel_files = filtered_files
@@ -531,10 +551,22 @@ def main():
     print(f"\n[INFO] Found {len(excel_files)} Excel files")
     print(f"[INFO] Processing files from: {EXCEL_DIR}")
 
-    results = []
-    for excel_file in sorted(excel_files):
-        result = process_excel_file(excel_file, financial_year)
-        results.append(result)
+    # Preload lookups once instead of querying per row
+    institution_ids = load_institution_ids()
+    existing_dcb = load_existing_dcb_institutions(financial_year)
+    print(f"[INFO] Loaded {len(institution_ids)} institutions, {len(existing_dcb)} existing DCB records for {financial_year}")
+
+    # Files are independent and dominated by Supabase round-trips, so overlap them in threads.
+    # The shared client's HTTP session is thread-safe once created; supabase.postgrest above
+    # was already initialised by the preload queries. postgrest-py opens that session with
+    # http2=True (gzip is httpx's default), so all workers multiplex over one kept-alive
+    # connection and no extra pool tuning is needed.
+    workers = max(1, args.workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda f: process_excel_file(f, financial_year, institution_ids, existing_dcb),
+            sorted(excel_files),
+        ))
 
     # Final summary
     print("\n" + "=" * 80)
@@ -8,9 +8,31 @@ import pandas as pd
 import sys
 import os
 import json
+import itertools
 from pathlib import Path
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, TextIO, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from _ap_numbers import normalize_ap_column
+
+# Rust-based calamine reader is much faster than openpyxl; fall back if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+_CURRENCY_RE = re.compile(r'[₹,\s]')
+_FINANCIAL_YEAR_RE = re.compile(r'20\d{2}[-/]20\d{2}')
+_YEAR_FIRST_RE = re.compile(r'\d{4}[-/.]')
+
+# Placeholder strings treated as empty cells
+_DATE_NULLS = frozenset({"-", "", "nan", "NaN"})
+_SQL_NULLS = _DATE_NULLS | {"None"}
+
+# Column-number row under the header ("2", "3") and other non-data cells
+_SKIP_AP_NO = frozenset({"nan", "NaN", "2", "-", ""})
+_SKIP_NAME = frozenset({"nan", "NaN", "3", ""})
 
 EXCEL_FILE = Path(__file__).parent.parent / "assets" / "DCB CODES-19-12-2025.xlsx"
 
@@ -45,247 +67,245 @@ DISTRICT_MAPPING = {
     "2025-2026": None,
 }
 
-def clean_numeric(value) -> float:
-    """Convert value to numeric"""
-    if pd.isna(value) or value is None:
-        return 0.0
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        value = value.strip()
-        if value in ["-", "", "nan", "NaN", "None", "Shops"]:
-            return 0.0
-        value = re.sub(r'[₹,\s]', '', value)
-        try:
-            return float(value)
-        except:
-            return 0.0
-    return 0.0
-
-def parse_date(date_str) -> Optional[str]:
-    """Parse date string"""
-    if pd.isna(date_str) or not date_str:
-        return None
-    date_str = str(date_str).strip()
-    if date_str in ["-", "", "nan", "NaN"]:
-        return None
+def text_column(df: pd.DataFrame, col: int) -> pd.Series:
+    """Whole column as stripped strings (<NA> for blanks or missing columns)"""
+    if col >= df.shape[1]:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    return df.iloc[:, col].astype("string").str.strip()
+
+def numeric_column(df: pd.DataFrame, col: int) -> List[float]:
+    """Whole column as floats (₹, commas and spaces stripped; placeholders and blanks -> 0.0)"""
+    if col >= df.shape[1]:
+        return [0.0] * len(df)
+    cleaned = df.iloc[:, col].astype("string").str.replace(_CURRENCY_RE, '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0).astype(float).tolist()
+
+def null_placeholders(text: pd.Series, extra_nulls: Tuple[str, ...] = ()) -> pd.Series:
+    """Blank out placeholder cells ("-", "nan", ...) in a column produced by text_column"""
+    return text.mask(text.isin(_SQL_NULLS.union(extra_nulls)))
+
+def parse_date_column(text: pd.Series) -> pd.Series:
+    """Parse a column of date strings to YYYY-MM-DD (<NA> when unparseable)"""
+    # Sheets write dates day-first, but dayfirst=True would swap month and day
+    # of ISO dates, so those are parsed in their own pass
+    dates = pd.Series(pd.NaT, index=text.index, dtype="datetime64[ns]")
+    year_first = text.str.match(_YEAR_FIRST_RE).fillna(False).astype(bool)
+    for subset, dayfirst in ((year_first, False), (~year_first & text.notna(), True)):
+        if subset.any():
+            dates[subset] = pd.to_datetime(text[subset], format="mixed", dayfirst=dayfirst, errors="coerce")
+    return dates.dt.strftime("%Y-%m-%d").astype("string")
+
+def receipt_columns(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Split a column of "NUMBER/DATE" strings into receipt numbers and dates"""
+    text = text.mask(text.isin(_DATE_NULLS))
+    has_date = text.str.contains("/", regex=False).fillna(False).astype(bool)
+    parts = text.where(has_date).str.rsplit("/", n=1)
+    numbers = parts.str[0].astype("string").str.strip()
+    dates = parts.str[1].astype("string").str.strip()
+    return numbers, parse_date_column(dates)
+
+def to_list(values: pd.Series) -> List[Optional[str]]:
+    """Column values as a plain list with None for missing entries"""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+INSTITUTION_COLUMNS = ["name", "code", "district_name", "mandal", "village", "address"]
+DCB_COLUMNS = [
+    "ap_no", "institution_name", "district_name", "financial_year", "mandal", "village",
+    "ext_dry", "ext_wet", "d_arrears", "d_current", "c_arrears", "c_current",
+    "receipt_no", "receipt_date", "challan_no", "challan_date", "remarks",
+]
+
+_workbook: Optional[pd.ExcelFile] = None
+
+def _open_workbook() -> pd.ExcelFile:
+    """Open the workbook once per process (ExcelFile handles can't be shared with workers)"""
+    global _workbook
+    if _workbook is None:
+        _workbook = pd.ExcelFile(EXCEL_FILE, engine=EXCEL_ENGINE)
+    return _workbook
+
+def process_sheet(sheet_name: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Process one sheet and return its institutions and DCB data as column-oriented frames"""
     try:
-        if "/" in date_str and "-" in date_str:
-            parts = date_str.split("/")
-            if len(parts) >= 3:
-                date_part = parts[-1]
-                if "-" in date_part:
-                    d, m, y = date_part.split("-")
-                    return f"{y}-{m}-{d}"
-        if "-" in date_str and len(date_str.split("-")) == 3:
-            d, m, y = date_str.split("-")
-            return f"{y}-{m}-{d}"
-        date_obj = pd.to_datetime(date_str, errors='coerce')
-        if pd.notna(date_obj):
-            return date_obj.strftime("%Y-%m-%d")
-    except:
-        pass
-    return None
-
-def extract_receipt_info(receipt_str: str) -> Tuple[Optional[str], Optional[str]]:
-    """Extract receipt number and date"""
-    if pd.isna(receipt_str) or not receipt_str:
-        return None, None
-    receipt_str = str(receipt_str).strip()
-    if receipt_str in ["-", "", "nan", "NaN"]:
-        return None, None
-    receipt_no = None
-    receipt_date = None
-    if "/" in receipt_str:
-        parts = receipt_str.split("/")
-        if len(parts) >= 2:
-            receipt_no = "/".join(parts[:-1])
-            date_part = parts[-1]
-            receipt_date = parse_date(date_part)
-    return receipt_no, receipt_date
-
-def escape_sql_string(value: Optional[str]) -> Optional[str]:
-    """Escape SQL string"""
-    if value is None or pd.isna(value):
-        return None
-    value = str(value).strip()
-    if value in ["-", "", "nan", "NaN", "None"]:
-        return None
-    # Escape single quotes
-    value = value.replace("'", "''")
-    return value
-
-def process_all_sheets() -> Tuple[List[Dict], List[Dict]]:
-    """Process all sheets and return institutions and DCB data"""
-    excel_file = pd.ExcelFile(EXCEL_FILE)
-    sheet_names = excel_file.sheet_names
-
-    all_institutions = []
-    all_dcb_records = []
-    district_ids = {}  # Cache district IDs
+        # One parse per sheet, reusing this process's open workbook; the title
+        # row and the data rows are both sliced from this frame. Every cell is
+        # read as text since the column cleaners parse values themselves.
+        df_raw = _open_workbook().parse(sheet_name, header=None, dtype=str)
+
+        # Extract district and financial year
+        district_name = DISTRICT_MAPPING.get(sheet_name, "UNKNOWN")
+        financial_year = "2025-26"
+
+        title_row = df_raw.iloc[0, 0] if len(df_raw) > 0 else None
+        if pd.notna(title_row):
+            title_str = str(title_row).upper()
+            if "YEAR" in title_str or "2025" in title_str:
+                year_match = _FINANCIAL_YEAR_RE.search(title_str)
+                if year_match:
+                    year_str = year_match.group()
+                    financial_year = year_str.replace("/", "-")
+
+        # Data starts after the title and two header rows
+        df_data = df_raw.iloc[3:].dropna(how='all')
+
+        # Drop rows without a usable AP number or name (this also removes the
+        # column-number row under the header)
+        ap_nos = normalize_ap_column(text_column(df_data, 1))
+        names = text_column(df_data, 2)
+        keep = (
+            ap_nos.notna() & ~ap_nos.isin(_SKIP_AP_NO)
+            & names.notna() & ~names.isin(_SKIP_NAME)
+        ).fillna(False).astype(bool)
+        df_data = df_data[keep]
+
+        # Every column is cleaned in one vectorized pass and stored as-is; no
+        # per-row dicts are built
+        institution_names = to_list(null_placeholders(names[keep]))
+        mandals = to_list(null_placeholders(text_column(df_data, 3), ("4",)))
+        villages = to_list(null_placeholders(text_column(df_data, 4), ("5",)))
+        receipt_nos, receipt_dates = receipt_columns(text_column(df_data, 11))
+        challan_nos, challan_dates = receipt_columns(text_column(df_data, 12))
+
+        dcb_records = pd.DataFrame({
+            "ap_no": to_list(ap_nos[keep]),
+            "institution_name": institution_names,
+            "district_name": district_name,
+            "financial_year": financial_year,
+            "mandal": mandals,
+            "village": villages,
+            # Extents of zero mean "not recorded"; the SQL writer emits NULL for them
+            "ext_dry": numeric_column(df_data, 5),
+            "ext_wet": numeric_column(df_data, 6),
+            "d_arrears": numeric_column(df_data, 8),
+            "d_current": numeric_column(df_data, 9),
+            "c_arrears": numeric_column(df_data, 13),
+            "c_current": numeric_column(df_data, 14),
+            "receipt_no": to_list(null_placeholders(receipt_nos)),
+            "receipt_date": to_list(receipt_dates),
+            "challan_no": to_list(null_placeholders(challan_nos)),
+            "challan_date": to_list(challan_dates),
+            "remarks": to_list(null_placeholders(text_column(df_data, 19), ("20",))),
+        }, columns=DCB_COLUMNS)
+
+        institutions = pd.DataFrame({
+            "name": institution_names,
+            "code": dcb_records["ap_no"].tolist(),
+            "district_name": district_name,
+            "mandal": mandals,
+            "village": villages,
+            "address": [f"{v}, {m}" if v and m else (v or m) for v, m in zip(villages, mandals)],
+        }, columns=INSTITUTION_COLUMNS)
+
+        return institutions, dcb_records
+
+    except Exception as e:
+        print(f"  [ERROR] Failed to process sheet {sheet_name}: {str(e)}")
+        return pd.DataFrame(columns=INSTITUTION_COLUMNS), pd.DataFrame(columns=DCB_COLUMNS)
+
+def process_all_sheets() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Process all sheets in parallel and return institutions and DCB data"""
+    # Only read the sheet list here; each worker opens its own handle
+    with pd.ExcelFile(EXCEL_FILE, engine=EXCEL_ENGINE) as excel_file:
+        sheet_names = excel_file.sheet_names
+
+    institution_frames = []
+    dcb_frames = []
 
     print(f"Processing {len(sheet_names)} sheets...")
 
-    for sheet_idx, sheet_name in enumerate(sheet_names, 1):
-        print(f"\n[{sheet_idx}/{len(sheet_names)}] Processing: {sheet_name}")
-
-        try:
-            df_raw = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name, header=None)
-
-            # Extract district and financial year
-            district_name = DISTRICT_MAPPING.get(sheet_name, "UNKNOWN")
-            financial_year = "2025-26"
-
-            title_row = df_raw.iloc[0, 0] if len(df_raw) > 0 else None
-            if pd.notna(title_row):
-                title_str = str(title_row).upper()
-                if "YEAR" in title_str or "2025" in title_str:
-                    year_match = re.search(r'20\d{2}[-/]20\d{2}', title_str)
-                    if year_match:
-                        year_str = year_match.group()
-                        financial_year = year_str.replace("/", "-")
-
-            # Get district ID
-            if district_name not in district_ids:
-                # Will be resolved later with SQL
-                district_ids[district_name] = None
-
-            # Read data
-            df_data = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name, skiprows=3, header=None)
-            df_data = df_data.dropna(how='all')
-
-            for idx, row in df_data.iterrows():
-                try:
-                    ap_no = str(row.iloc[1]).strip() if len(row) > 1 and pd.notna(row.iloc[1]) else None
-                    if not ap_no or ap_no in ["nan", "NaN", "2", "-", ""]:
-                        continue
-
-                    institution_name = str(row.iloc[2]).strip() if len(row) > 2 and pd.notna(row.iloc[2]) else None
-                    if not institution_name or institution_name in ["nan", "NaN", "3", ""]:
-                        continue
-
-                    mandal = str(row.iloc[3]).strip() if len(row) > 3 and pd.notna(row.iloc[3]) else None
-                    village = str(row.iloc[4]).strip() if len(row) > 4 and pd.notna(row.iloc[4]) else None
-                    ext_dry = clean_numeric(row.iloc[5]) if len(row) > 5 else 0.0
-                    ext_wet = clean_numeric(row.iloc[6]) if len(row) > 6 else 0.0
-                    d_arrears = clean_numeric(row.iloc[8]) if len(row) > 8 else 0.0
-                    d_current = clean_numeric(row.iloc[9]) if len(row) > 9 else 0.0
-
-                    receipt_str = str(row.iloc[11]).strip() if len(row) > 11 and pd.notna(row.iloc[11]) else None
-                    challan_str = str(row.iloc[12]).strip() if len(row) > 12 and pd.notna(row.iloc[12]) else None
-
-                    receipt_no, receipt_date = extract_receipt_info(receipt_str) if receipt_str else (None, None)
-                    challan_no, challan_date = extract_receipt_info(challan_str) if challan_str else (None, None)
-
-                    c_arrears = clean_numeric(row.iloc[13]) if len(row) > 13 else 0.0
-                    c_current = clean_numeric(row.iloc[14]) if len(row) > 14 else 0.0
-                    remarks = str(row.iloc[19]).strip() if len(row) > 19 and pd.notna(row.iloc[19]) else None
-
-                    # Clean data
-                    mandal = escape_sql_string(mandal) if mandal and mandal not in ["nan", "4"] else None
-                    village = escape_sql_string(village) if village and village not in ["nan", "5"] else None
-                    institution_name_clean = escape_sql_string(institution_name)
-                    remarks_clean = escape_sql_string(remarks) if remarks and remarks not in ["nan", "20"] else None
-                    receipt_no_clean = escape_sql_string(receipt_no)
-                    challan_no_clean = escape_sql_string(challan_no)
-
-                    # Institution data
-                    institution = {
-                        "name": institution_name_clean,
-                        "code": ap_no,
-                        "district_name": district_name,
-                        "mandal": mandal,
-                        "village": village,
-                        "address": f"{village}, {mandal}" if village and mandal else (village or mandal),
-                    }
-
-                    # DCB data
-                    dcb = {
-                        "ap_no": ap_no,
-                        "institution_name": institution_name_clean,
-                        "district_name": district_name,
-                        "financial_year": financial_year,
-                        "mandal": mandal,
-                        "village": village,
-                        "ext_dry": ext_dry if ext_dry > 0 else None,
-                        "ext_wet": ext_wet if ext_wet > 0 else None,
-                        "d_arrears": d_arrears,
-                        "d_current": d_current,
-                        "c_arrears": c_arrears,
-                        "c_current": c_current,
-                        "receipt_no": receipt_no_clean,
-                        "receipt_date": receipt_date,
-                        "challan_no": challan_no_clean,
-                        "challan_date": challan_date,
-                        "remarks": remarks_clean,
-                    }
-
-                    all_institutions.append(institution)
-                    all_dcb_records.append(dcb)
-
-                except Exception as e:
-                    print(f"  [WARNING] Error processing row {idx}: {str(e)}")
-                    continue
-
-            print(f"  [SUCCESS] Processed {len([i for i in all_institutions if i.get('district_name') == district_name])} records")
-
-        except Exception as e:
-            print(f"  [ERROR] Failed to process sheet: {str(e)}")
-            continue
+    # Sheets are independent and the work is CPU-bound pandas/Python, so fan
+    # out across processes rather than threads
+    max_workers = min(len(sheet_names), os.cpu_count() or 1) or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(process_sheet, sheet_names)
+        for sheet_idx, (sheet_name, (institutions, dcb_records)) in enumerate(zip(sheet_names, results), 1):
+            print(f"\n[{sheet_idx}/{len(sheet_names)}] {sheet_name}: processed {len(dcb_records)} records")
+            if len(dcb_records):
+                institution_frames.append(institutions)
+                dcb_frames.append(dcb_records)
+
+    all_institutions = pd.concat(institution_frames, ignore_index=True) if institution_frames else pd.DataFrame(columns=INSTITUTION_COLUMNS)
+    all_dcb_records = pd.concat(dcb_frames, ignore_index=True) if dcb_frames else pd.DataFrame(columns=DCB_COLUMNS)
+    # The same institution shows up on many DCB rows; emit it once per district
+    # (first occurrence wins) rather than leaving duplicates to the database
+    all_institutions = all_institutions.drop_duplicates(["code", "district_name"], keep="first", ignore_index=True)
+
+    # ~27 distinct district names repeated across every row
+    all_institutions["district_name"] = all_institutions["district_name"].astype("category")
+    all_dcb_records["district_name"] = all_dcb_records["district_name"].astype("category")
 
     print(f"\n[SUMMARY] Total Institutions: {len(all_institutions)}")
     print(f"[SUMMARY] Total DCB Records: {len(all_dcb_records)}")
 
     return all_institutions, all_dcb_records
 
-def generate_sql_inserts(institutions: List[Dict], dcb_records: List[Dict]) -> str:
-    """Generate SQL INSERT statements"""
-    sql_parts = []
-
-    # First, get district IDs mapping
-    sql_parts.append("-- Get district IDs")
-    sql_parts.append("DO $$")
-    sql_parts.append("DECLARE")
-    sql_parts.append("  district_map JSONB := '{}'::JSONB;")
-    sql_parts.append("BEGIN")
-
-    # Get all districts
-    districts_sql = """
-    FOR d IN SELECT id, name FROM districts LOOP
-      district_map := jsonb_set(district_map, ARRAY[LOWER(d.name)], to_jsonb(d.id));
-    END LOOP;
-    """
-    sql_parts.append(districts_sql)
-
-    # Insert institutions in batches
-    sql_parts.append("\n-- Insert Institutions")
+def _sql_text(value) -> str:
+    """Quoted SQL literal with single quotes escaped (NULL when missing or empty)"""
+    if not isinstance(value, str) or not value:
+        return 'NULL'
+    return "'" + value.replace("'", "''") + "'"
+
+def _positive(value) -> str:
+    """Numeric literal, NULL unless greater than zero"""
+    return f"{value}" if value > 0 else 'NULL'
+
+# unnest() column -> (literal renderer, array type), in institution_dcb column order
+DCB_UNNEST_COLUMNS = {
+    "financial_year": (_sql_text, "text[]"),
+    "ap_no": (_sql_text, "text[]"),
+    "institution_name": (_sql_text, "text[]"),
+    "district_name": (_sql_text, "text[]"),
+    "mandal": (_sql_text, "text[]"),
+    "village": (_sql_text, "text[]"),
+    "ext_dry": (_positive, "numeric[]"),
+    "ext_wet": (_positive, "numeric[]"),
+    "d_arrears": (str, "numeric[]"),
+    "d_current": (str, "numeric[]"),
+    "c_arrears": (str, "numeric[]"),
+    "c_current": (str, "numeric[]"),
+    "receipt_no": (_sql_text, "text[]"),
+    "receipt_date": (_sql_text, "date[]"),
+    "challan_no": (_sql_text, "text[]"),
+    "challan_date": (_sql_text, "date[]"),
+    "remarks": (_sql_text, "text[]"),
+}
+
+def write_sql_inserts(f: TextIO, institutions: pd.DataFrame, dcb_records: pd.DataFrame) -> None:
+    """Write SQL INSERT statements to an open file, one statement at a time"""
+    # District names are lowercased here once; each statement resolves them with a
+    # single join against districts instead of a per-row lookup
+    f.write("-- Insert Institutions\n")
     batch_size = 100
+    rows = zip(
+        institutions["name"].tolist(),
+        institutions["code"].tolist(),
+        institutions["district_name"].astype("string").str.lower().tolist(),
+        institutions["address"].tolist(),
+    )
     for i in range(0, len(institutions), batch_size):
-        batch = institutions[i:i+batch_size]
-        values = []
-        for inst in batch:
-            district_id_sql = f"(district_map->>LOWER('{inst['district_name']}'))::int"
-            name = inst['name'].replace("'", "''")
-            code = inst['code'].replace("'", "''")
-            address_val = inst.get('address')
-            if address_val:
-                address_escaped = address_val.replace("'", "''")
-                address_sql = f"'{address_escaped}'"
-            else:
-                address_sql = 'NULL'
-            values.append(f"('{name}', '{code}', {district_id_sql}, {address_sql}, true)")
-
-        sql_parts.append(f"INSERT INTO institutions (name, code, district_id, address, is_active) VALUES")
-        sql_parts.append(",\n".join(values) + ";")
-
-    # Insert DCB records (need institution_id, so use subquery)
-    sql_parts.append("\n-- Insert DCB Records")
-    for dcb in dcb_records:
-        district_id_sql = f"(district_map->>LOWER('{dcb['district_name']}'))::int"
-        inst_name = dcb['institution_name'].replace("'", "''")
-        ap_no = dcb['ap_no'].replace("'", "''")
-
-        sql = f"""
+        values = [
+            f"({_sql_text(name)}, {_sql_text(code)}, {_sql_text(district_key)}, {_sql_text(address)})"
+            for name, code, district_key, address in itertools.islice(rows, batch_size)
+        ]
+        f.write("INSERT INTO institutions (name, code, district_id, address, is_active)\n")
+        f.write("SELECT v.name, v.code, d.id, v.address, true\nFROM (VALUES\n")
+        f.write(",\n".join(values))
+        f.write("\n) AS v(name, code, district_key, address)\n")
+        f.write("LEFT JOIN districts d ON LOWER(d.name) = v.district_key;\n")
+
+    # Insert DCB records: one INSERT ... SELECT FROM unnest(...) per batch, so
+    # Postgres parses and plans a single statement per 1000 rows
+    f.write("\n-- Insert DCB Records\n")
+    dcb_batch_size = 1000
+    for i in range(0, len(dcb_records), dcb_batch_size):
+        # ON CONFLICT cannot touch the same row twice in one statement, so keep
+        # the last record per (ap_no, financial_year) like sequential upserts would
+        batch = dcb_records.iloc[i:i+dcb_batch_size].drop_duplicates(["ap_no", "financial_year"], keep="last")
+        arrays = ",\n  ".join(
+            f"ARRAY[{', '.join(map(render, batch[column].tolist()))}]::{sql_type}"
+            for column, (render, sql_type) in DCB_UNNEST_COLUMNS.items()
+        )
+        f.write(f"""
 INSERT INTO institution_dcb (
   institution_id, financial_year, ap_no, institution_name, district_name,
   mandal, village, ext_dry, ext_wet,
@@ -293,26 +313,14 @@ INSERT INTO institution_dcb (
   receipt_no, receipt_date, challan_no, challan_date, remarks
 )
 SELECT
-  i.id,
-  '{dcb['financial_year']}',
-  '{ap_no}',
-  '{inst_name}',
-  '{dcb['district_name']}',
-  {f"'{dcb['mandal']}'" if dcb.get('mandal') else 'NULL'},
-  {f"'{dcb['village']}'" if dcb.get('village') else 'NULL'},
-  {dcb['ext_dry'] if dcb.get('ext_dry') else 'NULL'},
-  {dcb['ext_wet'] if dcb.get('ext_wet') else 'NULL'},
-  {dcb['d_arrears']},
-  {dcb['d_current']},
-  {dcb['c_arrears']},
-  {dcb['c_current']},
-  {f"'{dcb['receipt_no']}'" if dcb.get('receipt_no') else 'NULL'},
-  {f"'{dcb['receipt_date']}'" if dcb.get('receipt_date') else 'NULL'},
-  {f"'{dcb['challan_no']}'" if dcb.get('challan_no') else 'NULL'},
-  {f"'{dcb['challan_date']}'" if dcb.get('challan_date') else 'NULL'},
-  {f"'{dcb['remarks']}'" if dcb.get('remarks') else 'NULL'}
-FROM institutions i
-WHERE i.code = '{ap_no}'
+  i.id, v.financial_year, v.ap_no, v.institution_name, v.district_name,
+  v.mandal, v.village, v.ext_dry, v.ext_wet,
+  v.d_arrears, v.d_current, v.c_arrears, v.c_current,
+  v.receipt_no, v.receipt_date, v.challan_no, v.challan_date, v.remarks
+FROM unnest(
+  {arrays}
+) AS v({", ".join(DCB_UNNEST_COLUMNS)})
+JOIN institutions i ON i.code = v.ap_no
 ON CONFLICT (ap_no, financial_year) DO UPDATE SET
   institution_name = EXCLUDED.institution_name,
   district_name = EXCLUDED.district_name,
@@ -330,12 +338,8 @@ ON CONFLICT (ap_no, financial_year) DO UPDATE SET
   challan_date = EXCLUDED.challan_date,
   remarks = EXCLUDED.remarks,
   updated_at = now();
-"""
-        sql_parts.append(sql)
-
-    sql_parts.append("END $$;")
 
-    return "\n".join(sql_parts)
+""")
 
 def main():
     """Main function"""
@@ -350,8 +354,7 @@ def main():
     # Process all sheets
     institutions, dcb_records = process_all_sheets()
 
-    # Generate SQL file
-    sql_content = generate_sql_inserts(institutions, dcb_records)
+    # Stream the SQL straight to disk instead of building it in memory
     sql_file = Path(__file__).parent.parent / "supabase" / "migrations" / "014_import_dcb_data.sql"
 
     with open(sql_file, 'w', encoding='utf-8') as f:
@@ -361,7 +364,7 @@ def main():
         f.write(f"-- Institutions: {len(institutions)}\n")
         f.write(f"-- DCB Records: {len(dcb_records)}\n")
         f.write("-- ============================================\n\n")
-        f.write(sql_content)
+        write_sql_inserts(f, institutions, dcb_records)
 
     print(f"\n[SUCCESS] SQL file generated: {sql_file}")
     print(f"[INFO] Run this migration in Supabase SQL Editor")
@@ -12,9 +12,20 @@ from typing import Dict, List, Optional
 import argparse
 from supabase import create_client, Client
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from _ap_numbers import normalize_ap_column
+
+# Rust-based calamine reader is much faster than openpyxl; fall back if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 
 # Configuration
 EXCEL_DIR = Path(__file__).parent.parent / "assets" / "Waqf Data"
+UPSERT_BATCH_SIZE = 500
+PAGE_SIZE = 1000  # PostgREST max rows per response
 
 # Try to get from environment variables first
 SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("EXPO_PUBLIC_SUPABASE_URL")
@@ -25,21 +36,14 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     env_file = Path(__file__).parent.parent / ".env"
     if env_file.exists():
         with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-
-                    if not SUPABASE_URL and (key == "SUPABASE_URL" or key == "EXPO_PUBLIC_SUPABASE_URL"):
-                        SUPABASE_URL = value
-                    if not SUPABASE_KEY and (key == "SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "SERVICE_ROLE_KEY"):
-                        SUPABASE_KEY = value
+            env = {
+                key.strip(): value.strip().strip('"').strip("'")
+                for key, sep, value in (line.strip().partition('=') for line in f)
+                if sep and key and not key.startswith('#')
+            }
+        SUPABASE_URL = SUPABASE_URL or env.get("SUPABASE_URL") or env.get("EXPO_PUBLIC_SUPABASE_URL")
+        SUPABASE_KEY = (SUPABASE_KEY or env.get("SUPABASE_SERVICE_ROLE_KEY") or
+                        env.get("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY") or env.get("SERVICE_ROLE_KEY"))
 
 if not SUPABASE_URL:
     print("[ERROR] SUPABASE_URL not found!")
@@ -94,14 +98,24 @@ def _parse_only_list(value: Optional[str]) -> List[str]:
         return []
     return [v.strip().lower() for v in value.split(",") if v.strip()]
 
-def clean_text(value) -> Optional[str]:
-    """Clean text value"""
-    if pd.isna(value) or value is None:
-        return None
-    text = str(value).strip()
-    if text.lower() in ["nan", "none", "", "-", "n/a", "na"]:
-        return None
-    return text if text else None
+# Cell values treated as empty, and header-like rows to drop (compared lowercased)
+NULL_TEXT = frozenset({"nan", "none", "", "-", "n/a", "na"})
+SKIP_AP_PATTERNS = frozenset({
+    "ap no", "ap gazette no", "gazette", "sl no", "s.no", "serial no",
+    "sno", "serial number", "1", "2", "3", "4", "5",
+})
+SKIP_NAME_PATTERNS = frozenset({"institution name", "name of institution", "name", "waqf name"})
+
+def clean_text_column(df: pd.DataFrame, col: Optional[int]) -> pd.Series:
+    """Clean a whole text column by label (<NA> for blank cells or a missing column)"""
+    if col is None or col not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    text = df[col].astype("string").str.strip()
+    return text.mask(text.str.lower().isin(NULL_TEXT))
+
+def to_list(values: pd.Series) -> List[Optional[str]]:
+    """Column values as a plain list with None for missing entries"""
+    return values.astype(object).where(values.notna(), None).tolist()
 
 def clean_numeric(value) -> float:
     """Clean numeric value"""
@@ -125,6 +139,28 @@ def get_district_id(district_name: str) -> Optional[str]:
         print(f"  [ERROR] Failed to get district ID for {district_name}: {e}")
         return None
 
+def load_institution_ids() -> Dict[str, str]:
+    """Map AP Gazette No -> institution UUID for all institutions, one page at a time"""
+    id_by_code = {}
+    offset = 0
+    while True:
+        page = (
+            supabase.table("institutions")
+            .select("id, ap_gazette_no")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute()
+            .data
+            or []
+        )
+        id_by_code.update((r["ap_gazette_no"], r["id"]) for r in page)
+        if len(page) < PAGE_SIZE:
+            return id_by_code
+        offset += PAGE_SIZE
+
+# ap_gazette_no is unique across districts, so creates vs updates are told apart against
+# every institution; loaded once in main() and extended as batches are written
+_institution_ids: Dict[str, str] = {}
+
 def process_excel_file(excel_file: Path) -> Dict:
     """Process a single Excel file and return statistics"""
     district_name = DISTRICT_MAPPING.get(excel_file.stem)
@@ -142,10 +178,10 @@ def process_excel_file(excel_file: Path) -> Dict:
         return {"status": "error", "error": f"District not found: {district_name}"}
 
     try:
-        # Read Excel file
-        df = pd.read_excel(excel_file)
-        print(f"  [INFO] Found {len(df)} rows in Excel file")
-        print(f"  [INFO] Columns: {list(df.columns)}")
+        # Open the workbook once; the header pass only needs the first row
+        xl = pd.ExcelFile(excel_file, engine=EXCEL_ENGINE)
+        columns = xl.parse(0, nrows=0).columns
+        print(f"  [INFO] Columns: {list(columns)}")
 
         # Try to identify column indices by searching column names
         ap_no_col = None
@@ -154,7 +190,7 @@ def process_excel_file(excel_file: Path) -> Dict:
         village_col = None
 
         # Search for columns by name (case-insensitive)
-        for idx, col in enumerate(df.columns):
+        for idx, col in enumerate(columns):
             col_str = str(col).lower().strip()
 
             # AP No/Gazette No column
@@ -178,101 +214,85 @@ def process_excel_file(excel_file: Path) -> Dict:
         # Usually: Sl No (0), AP No (1), Name (2), Mandal (3), Village (4)
         if ap_no_col is None:
             # Try column 1 (index 1) - most common position
-            if len(df.columns) > 1:
+            if len(columns) > 1:
                 ap_no_col = 1
             else:
                 ap_no_col = 0
 
         if name_col is None:
             # Try column 2 (index 2) - most common position
-            if len(df.columns) > 2:
+            if len(columns) > 2:
                 name_col = 2
-            elif len(df.columns) > 1:
+            elif len(columns) > 1:
                 name_col = 1
             else:
                 name_col = 0
 
-        if mandal_col is None and len(df.columns) > 3:
+        if mandal_col is None and len(columns) > 3:
             mandal_col = 3
 
-        if village_col is None and len(df.columns) > 4:
+        if village_col is None and len(columns) > 4:
             village_col = 4
 
         print(f"  [INFO] Column mapping:")
-        print(f"    AP No: Column {ap_no_col} ({df.columns[ap_no_col] if ap_no_col < len(df.columns) else 'N/A'})")
-        print(f"    Name: Column {name_col} ({df.columns[name_col] if name_col < len(df.columns) else 'N/A'})")
-        print(f"    Mandal: Column {mandal_col} ({df.columns[mandal_col] if mandal_col < len(df.columns) else 'N/A'})")
-        print(f"    Village: Column {village_col} ({df.columns[village_col] if village_col < len(df.columns) else 'N/A'})")
+        print(f"    AP No: Column {ap_no_col} ({columns[ap_no_col] if ap_no_col < len(columns) else 'N/A'})")
+        print(f"    Name: Column {name_col} ({columns[name_col] if name_col < len(columns) else 'N/A'})")
+        print(f"    Mandal: Column {mandal_col} ({columns[mandal_col] if mandal_col < len(columns) else 'N/A'})")
+        print(f"    Village: Column {village_col} ({columns[village_col] if village_col < len(columns) else 'N/A'})")
+
+        # Second pass loads only the columns we use, as text (we clean them ourselves).
+        # Skipping the header row keeps the labels equal to the positions found above.
+        used_cols = sorted({c for c in [ap_no_col, name_col, mandal_col, village_col] if c is not None})
+        with xl:
+            df = xl.parse(0, header=None, skiprows=1, usecols=used_cols, dtype=str)
+        print(f"  [INFO] Found {len(df)} rows in Excel file")
 
         institutions_created = 0
         institutions_updated = 0
         errors = []
-
-        for idx, row in df.iterrows():
+        # Keyed by ap_gazette_no: one upsert batch must not repeat a conflict key
+        records: Dict[str, Dict] = {}
+
+        ap_nos = normalize_ap_column(clean_text_column(df, ap_no_col))
+        names = clean_text_column(df, name_col)
+
+        # Drop rows missing required fields, header-like rows and bare row
+        # numbers (1-3 digit AP No) in one vectorized pass
+        mask = (
+            ap_nos.notna()
+            & names.notna()
+            & ~ap_nos.str.lower().isin(SKIP_AP_PATTERNS)
+            & ~names.str.lower().isin(SKIP_NAME_PATTERNS)
+            & ~ap_nos.str.fullmatch(r"\d{1,3}").fillna(False)
+        ).fillna(False).astype(bool)
+
+        for ap_no, institution_name, mandal, village in zip(
+            to_list(ap_nos[mask]),
+            to_list(names[mask]),
+            to_list(clean_text_column(df, mandal_col)[mask]),
+            to_list(clean_text_column(df, village_col)[mask]),
+        ):
+            records[ap_no] = {
+                "name": institution_name,
+                "ap_gazette_no": ap_no,
+                "district_id": district_id,
+                "mandal": mandal,
+                "village": village,
+                "is_active": True,
+            }
+
+        # Upsert in batches; ap_gazette_no is unique so the exists-check happens server-side
+        rows = list(records.values())
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
             try:
-                # Extract data safely
-                ap_no = None
-                institution_name = None
-                mandal = None
-                village = None
-
-                try:
-                    if ap_no_col is not None and ap_no_col < len(row):
-                        ap_no = clean_text(row.iloc[ap_no_col])
-                    if name_col is not None and name_col < len(row):
-                        institution_name = clean_text(row.iloc[name_col])
-                    if mandal_col is not None and mandal_col < len(row):
-                        mandal = clean_text(row.iloc[mandal_col])
-                    if village_col is not None and village_col < len(row):
-                        village = clean_text(row.iloc[village_col])
-                except (IndexError, KeyError) as e:
-                    continue
-
-                # Skip if missing required fields
-                if not ap_no or not institution_name:
-                    continue
-
-                # Skip header-like rows and invalid data
-                ap_no_lower = str(ap_no).lower() if ap_no else ""
-                name_lower = str(institution_name).lower() if institution_name else ""
-
-                skip_patterns = [
-                    "ap no", "ap gazette no", "gazette", "sl no", "s.no", "serial no",
-                    "sno", "serial number", "1", "2", "3", "4", "5"
-                ]
-
-                if ap_no_lower in skip_patterns or name_lower in ["institution name", "name of institution", "name", "waqf name"]:
-                    continue
-
-                # Skip if AP No is just a number (likely row number)
-                if ap_no.isdigit() and len(ap_no) <= 3:
-                    continue
-
-                # Check if institution already exists
-                existing = supabase.table("institutions").select("id").eq("ap_gazette_no", ap_no).execute()
-
-                institution_data = {
-                    "name": institution_name,
-                    "ap_gazette_no": ap_no,
-                    "district_id": district_id,
-                    "mandal": mandal,
-                    "village": village,
-                    "is_active": True,
-                }
-
-                if existing.data and len(existing.data) > 0:
-                    # Update existing
-                    result = supabase.table("institutions").update(institution_data).eq("id", existing.data[0]["id"]).execute()
-                    if result.data:
-                        institutions_updated += 1
-                else:
-                    # Create new
-                    result = supabase.table("institutions").insert(institution_data).execute()
-                    if result.data:
-                        institutions_created += 1
-
+                written = supabase.table("institutions").upsert(batch, on_conflict="ap_gazette_no").execute().data or []
+                existing = sum(1 for r in batch if r["ap_gazette_no"] in _institution_ids)
+                institutions_updated += existing
+                institutions_created += len(batch) - existing
+                _institution_ids.update((r["ap_gazette_no"], r["id"]) for r in written)
             except Exception as e:
-                error_msg = f"Row {idx + 2}: {str(e)}"
+                error_msg = f"Batch of {len(batch)} rows starting at {start}: {str(e)}"
                 errors.append(error_msg)
                 print(f"  [ERROR] {error_msg}")
 
@@ -306,6 +326,12 @@ def main():
         help="Comma-separated list of Excel file stems or district names to process (case-insensitive). Example: Adoni,ASRR,Eluru",
         default="",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of Excel files to process concurrently (default: 8, use 1 for ordered output)",
+        default=8,
+    )
     args = parser.parse_args()
     only = _parse_only_list(args.only)
 
@@ -339,10 +365,15 @@ def main():
     print(f"\n[INFO] Found {len(excel_files)} Excel files")
     print(f"[INFO] Processing files from: {EXCEL_DIR}")
 
-    results = []
-    for excel_file in sorted(excel_files):
-        result = process_excel_file(excel_file)
-        results.append(result)
+    _institution_ids.update(load_institution_ids())
+    print(f"[INFO] Existing institutions: {len(_institution_ids)}")
+
+    # Files are independent and dominated by Supabase round-trips, so overlap them in threads.
+    # The preload above already created the client's lazy PostgREST session, so the workers
+    # share that one instead of racing to build their own.
+    workers = max(1, args.workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(process_excel_file, sorted(excel_files)))
 
     # Final summary
     print("\n" + "=" * 80)
@@ -6,7 +6,8 @@ Imports:
 1) institutions (upsert by ap_gazette_no)
 2) institution_dcb (upsert by (institution_id, financial_year))
 
-It assigns inspector_id based on the institution's district (one inspector per district).
+inspector_id is filled in by the database from the institution's district (one inspector
+per district; see migration 025), so DCB rows are only sent for districts that have one.
 
 Required env vars:
   SUPABASE_URL=https://<project-ref>.supabase.co
@@ -18,45 +19,100 @@ from __future__ import annotations
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 from supabase import Client, create_client
 
+from _ap_numbers import normalize_ap_column
 
-ASSETS_XLSX = Path(__file__).parent.parent / "assets" / "Consolidated_Excel.xlsx"
+# Rust-based calamine reader is much faster than openpyxl; fall back if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+# Arrow-backed strings are compact and run most .str ops natively; fall back if pyarrow is missing
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
 
 
-def clean_text(v: Any) -> Optional[str]:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
-        return None
-    s = str(v).strip()
-    if not s or s.lower() in ("nan", "null", "none", "-"):
-        return None
-    # normalize whitespace
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-
-def clean_number(v: Any) -> float:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
-        return 0.0
-    if isinstance(v, (int, float)):
-        return float(v)
-    s = str(v).strip()
-    if not s or s.lower() in ("nan", "null", "none", "-", "shops"):
-        return 0.0
-    s = s.replace(",", "")
-    s = re.sub(r"[₹\s]", "", s)
-    try:
-        return float(s)
-    except Exception:
-        return 0.0
+ASSETS_XLSX = Path(__file__).parent.parent / "assets" / "Consolidated_Excel.xlsx"
+
+# Upserts are round-trip bound: send large batches, several at a time
+UPSERT_BATCH_SIZE = 1000
+UPSERT_WORKERS = 8
+# AP numbers per .in_() filter; keeps the request URL well under proxy limits
+LOOKUP_CHUNK_SIZE = 200
+
+# Python's \s spelled out as literal characters (the str.isspace() set), so the same
+# pattern behaves identically in re and in Arrow's RE2, whose \s is ASCII-only
+_WS_CHARS = "\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000"
+_WS_PATTERN = f"[{_WS_CHARS}]+"
+_CUR_PATTERN = f"[,₹{_WS_CHARS}]"
+# Compiled for norm_name; the column-wise cleaners pass the pattern strings
+_WS_RE = re.compile(_WS_PATTERN)
+
+# institution_dcb columns taken straight from the cleaned sheet
+DCB_FIELDS = [
+    "financial_year",
+    "extent_dry",
+    "extent_wet",
+    "demand_arrears",
+    "demand_current",
+    "collection_arrears",
+    "collection_current",
+    "remarks",
+]
 
 
 def norm_name(s: str) -> str:
-    return re.sub(r"\s+", " ", s.strip()).lower()
+    return _WS_RE.sub(" ", s.strip()).lower()
+
+
+def clean_text_series(s: pd.Series) -> pd.Series:
+    """Whole column stripped, with runs of whitespace collapsed (<NA> for blank cells)."""
+    s = s.astype(STRING_DTYPE).str.strip().str.replace(_WS_PATTERN, " ", regex=True)
+    return s.mask(s.str.lower().isin(("", "nan", "null", "none", "-")))
+
+
+def clean_number_series(s: pd.Series) -> pd.Series:
+    """Whole column as floats, commas and ₹ removed (0.0 for blanks and non-numbers)."""
+    s = s.astype(STRING_DTYPE).str.replace(_CUR_PATTERN, "", regex=True)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype(float)
+
+
+def to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame rows as JSON-ready dicts, with None for missing values."""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+def upsert_concurrently(
+    sb: Client, table: str, payload: List[Dict[str, Any]], on_conflict: str, label: str
+) -> List[Dict[str, Any]]:
+    """Upsert payload in UPSERT_BATCH_SIZE batches, UPSERT_WORKERS requests in flight.
+
+    Returns the written rows as sent back by PostgREST.
+    """
+    batches = [payload[i : i + UPSERT_BATCH_SIZE] for i in range(0, len(payload), UPSERT_BATCH_SIZE)]
+
+    def send(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return sb.table(table).upsert(batch, on_conflict=on_conflict).execute().data or []
+
+    written: List[Dict[str, Any]] = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as ex:
+        for batch, rows in zip(batches, ex.map(send, batches)):
+            written.extend(rows)
+            done += len(batch)
+            print(f"  - upserted {label}: {done}/{len(payload)}")
+    return written
 
 
 def main() -> int:
@@ -76,160 +132,159 @@ def main() -> int:
 
     sb: Client = create_client(supabase_url, supabase_key)
 
-    print(f"[INFO] Reading: {ASSETS_XLSX}")
-    df = pd.read_excel(ASSETS_XLSX, sheet_name=0)
-    df.columns = [str(c).strip() for c in df.columns]
-    print(f"[INFO] Rows: {len(df)}")
-
-    # Column aliases (be tolerant to variations)
-    def pick(*names: str) -> Optional[str]:
-        cols = {norm_name(c): c for c in df.columns}
-        for n in names:
-            if norm_name(n) in cols:
-                return cols[norm_name(n)]
-        return None
-
-    col_ap = pick("Ap Gazette No", "AP Gazette No", "AP No", "ap_gazette_no")
-    col_name = pick("Name of institution", "Name of Institution", "Name of the Institution", "institution_name")
-    col_district = pick("District", "district_name")
-    col_mandal = pick("Mandal", "mandal")
-    col_village = pick("Village", "village")
-    col_ext_dry = pick("Ext-Dry", "Extent Dry", "extent_dry")
-    col_ext_wet = pick("Ext-Wet", "Extent Wet", "extent_wet")
-    col_d_arrears = pick("D-Arrears", "Demand Arrears", "demand_arrears")
-    col_d_current = pick("D-Current", "Demand Current", "demand_current")
-    col_c_arrears = pick("C-Arrears", "Collection Arrears", "collection_arrears")
-    col_c_current = pick("C-Current", "Collection Current", "collection_current")
-    col_remarks = pick("Remarks", "remarks")
-    col_fy = pick("Financial Year", "financial_year")
-
-    required = {"Ap Gazette No": col_ap, "Name of institution": col_name, "District": col_district}
-    missing = [k for k, v in required.items() if not v]
-    if missing:
-        print(f"[ERROR] Missing required columns in Excel: {missing}")
-        print(f"[INFO] Columns found: {list(df.columns)}")
-        return 1
+    # Build the lazy PostgREST client before the lookup threads start, so they don't each create one
+    sb.postgrest
+
+    # Districts and inspector districts are independent lookups: fetch both in the background
+    # while the workbook is parsed
+    with ThreadPoolExecutor(max_workers=2) as lookups:
+        districts_future = lookups.submit(lambda: sb.table("districts").select("id,name").execute())
+        inspectors_future = lookups.submit(
+            lambda: sb.table("profiles").select("district_id").eq("role", "inspector").execute()
+        )
+
+        print(f"[INFO] Reading: {ASSETS_XLSX}")
+        # Header first, so the data pass below only parses the columns that get picked
+        xl = pd.ExcelFile(ASSETS_XLSX, engine=EXCEL_ENGINE)
+        columns = [str(c).strip() for c in xl.parse(0, nrows=0).columns]
+
+        # Column aliases (be tolerant to variations)
+        def pick(*names: str) -> Optional[str]:
+            cols = {norm_name(c): c for c in columns}
+            for n in names:
+                if norm_name(n) in cols:
+                    return cols[norm_name(n)]
+            return None
+
+        col_ap = pick("Ap Gazette No", "AP Gazette No", "AP No", "ap_gazette_no")
+        col_name = pick("Name of institution", "Name of Institution", "Name of the Institution", "institution_name")
+        col_district = pick("District", "district_name")
+        col_mandal = pick("Mandal", "mandal")
+        col_village = pick("Village", "village")
+        col_ext_dry = pick("Ext-Dry", "Extent Dry", "extent_dry")
+        col_ext_wet = pick("Ext-Wet", "Extent Wet", "extent_wet")
+        col_d_arrears = pick("D-Arrears", "Demand Arrears", "demand_arrears")
+        col_d_current = pick("D-Current", "Demand Current", "demand_current")
+        col_c_arrears = pick("C-Arrears", "Collection Arrears", "collection_arrears")
+        col_c_current = pick("C-Current", "Collection Current", "collection_current")
+        col_remarks = pick("Remarks", "remarks")
+        col_fy = pick("Financial Year", "financial_year")
+
+        required = {"Ap Gazette No": col_ap, "Name of institution": col_name, "District": col_district}
+        missing = [k for k, v in required.items() if not v]
+        if missing:
+            print(f"[ERROR] Missing required columns in Excel: {missing}")
+            print(f"[INFO] Columns found: {columns}")
+            return 1
+
+        picked = {
+            col_ap, col_name, col_district, col_mandal, col_village, col_ext_dry, col_ext_wet,
+            col_d_arrears, col_d_current, col_c_arrears, col_c_current, col_remarks, col_fy,
+        }
+        used_cols = [i for i, c in enumerate(columns) if c in picked]
+        # header=None keeps labels positional; dtype=str skips type inference (cleaners parse numbers)
+        with xl:
+            df = xl.parse(0, header=None, skiprows=1, usecols=used_cols, dtype=str)
+        df.columns = [columns[i] for i in df.columns]
+        print(f"[INFO] Rows: {len(df)}")
+
+        # A row without an AP number feeds neither payload, so drop it before any cleaning.
+        # Name and district are not required here: rows missing them still update DCB for
+        # institutions that already exist.
+        blank_ap = int(df[col_ap].isna().sum())
+        df = df.dropna(subset=[col_ap]).reset_index(drop=True)
+
+        districts = districts_future.result().data or []
+        inspectors = inspectors_future.result().data or []
 
     # Load districts mapping (by name)
-    districts = sb.table("districts").select("id,name").execute().data or []
-    district_by_name = {norm_name(d["name"]): d["id"] for d in districts}
+    district_df = pd.DataFrame(districts, columns=["id", "name"])
+    district_df["_key"] = clean_text_series(district_df["name"]).str.lower()
+    # Series keyed by normalized name; .map() on it is a hash join done inside pandas
+    district_by_name = district_df.dropna(subset=["_key"]).drop_duplicates("_key", keep="last").set_index("_key")["id"]
     print(f"[INFO] Districts loaded: {len(district_by_name)}")
 
-    # Load inspector per district mapping
-    inspectors = (
-        sb.table("profiles")
-        .select("id,full_name,district_id,role")
-        .eq("role", "inspector")
-        .execute()
-        .data
-        or []
+    # Districts with an inspector; the DCB insert trigger resolves the inspector itself,
+    # but a district without one would leave inspector_id NULL and fail the whole batch
+    inspector_districts = {i["district_id"] for i in inspectors if i.get("district_id")}
+    print(f"[INFO] Inspectors loaded: {len(inspector_districts)} (by district_id)")
+
+    def text_col(col: Optional[str]) -> pd.Series:
+        if not col:
+            return pd.Series(pd.NA, index=df.index, dtype=STRING_DTYPE)
+        return clean_text_series(df[col])
+
+    def number_col(col: Optional[str]) -> pd.Series:
+        if not col:
+            return pd.Series(0.0, index=df.index)
+        return clean_number_series(df[col])
+
+    # Clean every column once; both payloads below are built from this frame
+    rows = pd.DataFrame(
+        {
+            "ap_gazette_no": normalize_ap_column(text_col(col_ap)),
+            "name": text_col(col_name),
+            # Same normalization as the district keys: trimmed, single-spaced, lowercase
+            "district_id": text_col(col_district).str.lower().map(district_by_name),
+            "mandal": text_col(col_mandal),
+            "village": text_col(col_village),
+            "financial_year": text_col(col_fy).fillna("2025-26"),
+            "extent_dry": number_col(col_ext_dry),
+            "extent_wet": number_col(col_ext_wet),
+            "demand_arrears": number_col(col_d_arrears),
+            "demand_current": number_col(col_d_current),
+            "collection_arrears": number_col(col_c_arrears),
+            "collection_current": number_col(col_c_current),
+            "remarks": text_col(col_remarks),
+        }
     )
-    inspector_by_district = {i["district_id"]: i["id"] for i in inspectors if i.get("district_id")}
-    print(f"[INFO] Inspectors loaded: {len(inspector_by_district)} (by district_id)")
 
     # 1) Upsert institutions
-    inst_payload = []
-    skipped = 0
-    for _, row in df.iterrows():
-        ap = clean_text(row.get(col_ap))
-        name = clean_text(row.get(col_name))
-        district_name = clean_text(row.get(col_district))
-        if not ap or not name or not district_name:
-            skipped += 1
-            continue
-
-        district_id = district_by_name.get(norm_name(district_name))
-        if not district_id:
-            skipped += 1
-            continue
-
-        inst_payload.append(
-            {
-                "ap_gazette_no": ap,
-                "name": name,
-                "district_id": district_id,
-                "mandal": clean_text(row.get(col_mandal)) if col_mandal else None,
-                "village": clean_text(row.get(col_village)) if col_village else None,
-                "is_active": True,
-            }
-        )
-
+    inst_keep = rows[["ap_gazette_no", "name", "district_id"]].notna().all(axis=1)
+    skipped = blank_ap + int((~inst_keep).sum())
     # Deduplicate by ap_gazette_no (latest wins)
-    inst_by_ap: Dict[str, Dict[str, Any]] = {}
-    for rec in inst_payload:
-        inst_by_ap[rec["ap_gazette_no"]] = rec
-    inst_payload = list(inst_by_ap.values())
+    inst_payload = to_records(
+        rows.loc[inst_keep, ["ap_gazette_no", "name", "district_id", "mandal", "village"]]
+        .assign(is_active=True)
+        .drop_duplicates(subset=["ap_gazette_no"], keep="last")
+    )
 
     print(f"[INFO] Institutions to upsert: {len(inst_payload)} (skipped rows: {skipped})")
-    if inst_payload:
-        # upsert in batches
-        for i in range(0, len(inst_payload), 500):
-            batch = inst_payload[i : i + 500]
-            sb.table("institutions").upsert(batch, on_conflict="ap_gazette_no").execute()
-            print(f"  - upserted institutions: {min(i + 500, len(inst_payload))}/{len(inst_payload)}")
-
-    # Reload institutions id map
-    inst_rows = sb.table("institutions").select("id,ap_gazette_no,district_id").execute().data or []
+    inst_rows = upsert_concurrently(sb, "institutions", inst_payload, "ap_gazette_no", "institutions")
+
+    # The upsert hands back the rows it wrote; only sheet APs it skipped (no name or district)
+    # still need a lookup, in case they already exist in the DB
+    other_aps = sorted(set(rows["ap_gazette_no"].dropna()) - {r["ap_gazette_no"] for r in inst_rows})
+    for i in range(0, len(other_aps), LOOKUP_CHUNK_SIZE):
+        chunk = other_aps[i : i + LOOKUP_CHUNK_SIZE]
+        inst_rows += (
+            sb.table("institutions").select("id,ap_gazette_no,district_id").in_("ap_gazette_no", chunk).execute().data
+            or []
+        )
     inst_id_by_ap = {r["ap_gazette_no"]: r["id"] for r in inst_rows}
     inst_district_by_id = {r["id"]: r["district_id"] for r in inst_rows}
-    print(f"[INFO] Institutions in DB: {len(inst_id_by_ap)}")
+    print(f"[INFO] Institutions matched in DB: {len(inst_id_by_ap)}")
 
     # 2) Upsert institution_dcb
-    dcb_payload = []
-    dcb_skipped = 0
-    for _, row in df.iterrows():
-        ap = clean_text(row.get(col_ap))
-        if not ap:
-            dcb_skipped += 1
-            continue
-        institution_id = inst_id_by_ap.get(ap)
-        if not institution_id:
-            dcb_skipped += 1
-            continue
-
-        district_id = inst_district_by_id.get(institution_id)
-        inspector_id = inspector_by_district.get(district_id)
-        if not inspector_id:
-            dcb_skipped += 1
-            continue
-
-        fy = clean_text(row.get(col_fy)) if col_fy else None
-        fy = fy or "2025-26"
-
-        dcb_payload.append(
-            {
-                "institution_id": institution_id,
-                "inspector_id": inspector_id,
-                "financial_year": fy,
-                "extent_dry": clean_number(row.get(col_ext_dry)) if col_ext_dry else 0,
-                "extent_wet": clean_number(row.get(col_ext_wet)) if col_ext_wet else 0,
-                "demand_arrears": clean_number(row.get(col_d_arrears)) if col_d_arrears else 0,
-                "demand_current": clean_number(row.get(col_d_current)) if col_d_current else 0,
-                "collection_arrears": clean_number(row.get(col_c_arrears)) if col_c_arrears else 0,
-                "collection_current": clean_number(row.get(col_c_current)) if col_c_current else 0,
-                "remarks": clean_text(row.get(col_remarks)) if col_remarks else None,
-            }
-        )
+    institution_id = rows["ap_gazette_no"].map(inst_id_by_ap)
+    has_inspector = institution_id.map(inst_district_by_id).isin(inspector_districts)
+    dcb_keep = institution_id.notna() & has_inspector
+    dcb_skipped = blank_ap + int((~dcb_keep).sum())
+    # Deduplicate by (institution_id, financial_year), latest wins
+    dcb_payload = to_records(
+        rows.loc[dcb_keep, DCB_FIELDS]
+        .assign(institution_id=institution_id[dcb_keep])
+        .drop_duplicates(subset=["institution_id", "financial_year"], keep="last")
+    )
+
+    print(f"[INFO] DCB rows to upsert: {len(dcb_payload)} (skipped rows: {dcb_skipped})")
+    upsert_concurrently(sb, "institution_dcb", dcb_payload, "institution_id,financial_year", "dcb")
 
-    # Deduplicate by (institution_id, financial_year)
-    dcb_keyed: Dict[str, Dict[str, Any]] = {}
-    for rec in dcb_payload:
-        key = f\"{rec['institution_id']}::{rec['financial_year']}\"
-        dcb_keyed[key] = rec
-    dcb_payload = list(dcb_keyed.values())
-
-    print(f\"[INFO] DCB rows to upsert: {len(dcb_payload)} (skipped rows: {dcb_skipped})\")
-    if dcb_payload:
-        for i in range(0, len(dcb_payload), 500):
-            batch = dcb_payload[i : i + 500]
-            sb.table(\"institution_dcb\").upsert(batch, on_conflict=\"institution_id,financial_year\").execute()
-            print(f\"  - upserted dcb: {min(i + 500, len(dcb_payload))}/{len(dcb_payload)}\")
-
-    print(\"[DONE] Import complete.\")
+    print("[DONE] Import complete.")
     return 0
 
 
-if __name__ == \"__main__\":
+if __name__ == "__main__":
     raise SystemExit(main())
 
 
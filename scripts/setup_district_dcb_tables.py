@@ -5,35 +5,12 @@ Deletes existing DCB data and creates separate tables for each district
 Each table has auto-calculated balance columns
 """
 
-import os
+import re
 import sys
+from functools import lru_cache
 from pathlib import Path
 from supabase import create_client, Client
-
-# Configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("EXPO_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY")
-
-# Try to read from .env file if not in environment
-if not SUPABASE_URL or not SUPABASE_KEY:
-    env_file = Path(__file__).parent.parent / ".env"
-    if env_file.exists():
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-
-                    if not SUPABASE_URL and (key == "SUPABASE_URL" or key == "EXPO_PUBLIC_SUPABASE_URL"):
-                        SUPABASE_URL = value
-                    if not SUPABASE_KEY and (key == "SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "SERVICE_ROLE_KEY"):
-                        SUPABASE_KEY = value
+from _config import SUPABASE_URL, SUPABASE_KEY
 
 if not SUPABASE_URL:
     print("[ERROR] SUPABASE_URL not found!")
@@ -45,24 +22,10 @@ if not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def sanitize_table_name(district_name: str) -> str:
-    """Convert district name to valid PostgreSQL table name"""
-    # Convert to lowercase and replace spaces/special chars with underscores
-    name = district_name.lower()
-    name = name.replace(' ', '_')
-    name = name.replace('.', '_')
-    name = name.replace('-', '_')
-    name = name.replace("'", '')
-    # Remove multiple underscores
-    while '__' in name:
-        name = name.replace('__', '_')
-    # Remove leading/trailing underscores
-    name = name.strip('_')
-    return f"dcb_{name}"
+_TABLE_NAME_SEP_RE = re.compile(r"[ ._-]+")
 
-def create_district_dcb_table(district_name: str, table_name: str) -> str:
-    """Generate SQL to create a district-specific DCB table"""
-    sql = f"""
+# Per-district DDL; filled in with str.format(district_name=..., table_name=...)
+DISTRICT_TABLE_SQL = """
 -- Create DCB table for {district_name}
 CREATE TABLE IF NOT EXISTS public.{table_name} (
   id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -147,7 +110,30 @@ CREATE POLICY "{table_name}_delete_policy"
 -- Add comment
 COMMENT ON TABLE public.{table_name} IS 'DCB data for {district_name} district';
 """
-    return sql
+
+MIGRATION_HEADER = (
+    "-- ============================================\n"
+    "-- Create District-Specific DCB Tables\n"
+    "-- Each district gets its own DCB table with auto-calculated balance columns\n"
+    "-- ============================================\n\n"
+    "-- Delete existing DCB data\n"
+    "TRUNCATE TABLE public.institution_dcb CASCADE;\n\n"
+    "-- ============================================\n"
+    "-- Create tables for each district\n"
+    "-- ============================================\n\n"
+)
+
+@lru_cache(maxsize=128)
+def sanitize_table_name(district_name: str) -> str:
+    """Convert district name to valid PostgreSQL table name"""
+    # Lowercase, drop apostrophes, turn each run of spaces/dots/dashes/underscores into one
+    # underscore, then trim underscores from the ends
+    name = _TABLE_NAME_SEP_RE.sub('_', district_name.lower().replace("'", ''))
+    return f"dcb_{name.strip('_')}"
+
+def create_district_dcb_table(district_name: str, table_name: str) -> str:
+    """Generate SQL to create a district-specific DCB table"""
+    return DISTRICT_TABLE_SQL.format(district_name=district_name, table_name=table_name)
 
 def main():
     print("=" * 80)
@@ -212,21 +198,10 @@ def main():
     migration_file = Path(__file__).parent.parent / "supabase" / "migrations" / "020_create_district_dcb_tables.sql"
     migration_file.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(migration_file, 'w', encoding='utf-8') as f:
-        f.write("-- ============================================\n")
-        f.write("-- Create District-Specific DCB Tables\n")
-        f.write("-- Each district gets its own DCB table with auto-calculated balance columns\n")
-        f.write("-- ============================================\n\n")
-        f.write("-- Delete existing DCB data\n")
-        f.write("TRUNCATE TABLE public.institution_dcb CASCADE;\n\n")
-        f.write("-- ============================================\n")
-        f.write("-- Create tables for each district\n")
-        f.write("-- ============================================\n\n")
-
-        for table_info in created_tables:
-            f.write(f"-- {table_info['district']}\n")
-            f.write(table_info['sql'])
-            f.write("\n\n")
+    # Assemble the whole file in memory and write it in one go
+    parts = [MIGRATION_HEADER]
+    parts.extend(f"-- {t['district']}\n{t['sql']}\n\n" for t in created_tables)
+    migration_file.write_text("".join(parts), encoding='utf-8')
 
     print(f"[OK] Migration file created: {migration_file}")
 
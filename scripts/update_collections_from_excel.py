@@ -4,39 +4,30 @@ Update Collection Data (C-Arrears, C-Current) in institution_dcb from Excel File
 This script updates existing DCB records with collection amounts from Excel files
 """
 
+import numpy as np
 import pandas as pd
 import sys
 import os
 from pathlib import Path
-from typing import Dict, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
 from supabase import create_client, Client
+from _config import SUPABASE_URL, SUPABASE_KEY
+from _ap_numbers import normalize_ap_no
+
+# Rust-based calamine reader is much faster than openpyxl; fall back if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 
 # Configuration
 EXCEL_DIR = Path(__file__).parent.parent / "assets" / "Waqf Data"
-
-# Try to read from .env file
-SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("EXPO_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    env_file = Path(__file__).parent.parent / ".env"
-    if env_file.exists():
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-
-                    if not SUPABASE_URL and (key == "SUPABASE_URL" or key == "EXPO_PUBLIC_SUPABASE_URL"):
-                        SUPABASE_URL = value
-                    if not SUPABASE_KEY and (key == "SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "EXPO_PUBLIC_SUPABASE_SERVICE_ROLE_KEY" or
-                                            key == "SERVICE_ROLE_KEY"):
-                        SUPABASE_KEY = value
+FINANCIAL_YEAR = "2024-25"
+UPSERT_BATCH_SIZE = 1000
+UPSERT_WORKERS = 8  # batches in flight at once; upserts are round-trip bound
+PAGE_SIZE = 1000  # PostgREST max rows per response
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("[ERROR] Missing Supabase credentials!")
@@ -77,83 +68,115 @@ def clean_numeric(value) -> float:
     except (ValueError, TypeError):
         return 0.0
 
-def get_institution_id(ap_gazette_no: str) -> Optional[str]:
+def fetch_all_rows(table: str, columns: str, filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Fetch every matching row of a table, one page at a time"""
+    rows = []
+    offset = 0
+    while True:
+        query = supabase.table(table).select(columns)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        page = query.range(offset, offset + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+def load_institution_ids() -> Dict[str, str]:
+    """Map AP Gazette No -> institution UUID for all institutions"""
+    rows = fetch_all_rows("institutions", "id, ap_gazette_no")
+    return {r["ap_gazette_no"]: r["id"] for r in rows}
+
+def load_dcb_inspectors(financial_year: str) -> Dict[str, str]:
+    """Map institution UUID -> inspector UUID for existing DCB records of one financial year"""
+    rows = fetch_all_rows("institution_dcb", "institution_id, inspector_id", {"financial_year": financial_year})
+    return {r["institution_id"]: r["inspector_id"] for r in rows}
+
+def upsert_dcb_batch(rows: List[Dict]) -> int:
+    """Write collection amounts for a batch of existing DCB records in one request"""
+    supabase.table("institution_dcb").upsert(rows, on_conflict="institution_id,financial_year").execute()
+    return len(rows)
+
+# Lookup maps for parse workers, set once per process by init_worker
+_institution_ids: Dict[str, str] = {}
+_dcb_inspectors: Dict[str, str] = {}
+
+def init_worker(institution_ids: Dict[str, str], dcb_inspectors: Dict[str, str]) -> None:
+    """Receive the preloaded lookup maps once per worker process instead of once per file"""
+    global _institution_ids, _dcb_inspectors
+    _institution_ids = institution_ids
+    _dcb_inspectors = dcb_inspectors
+
+def parse_excel_file(excel_file: Path) -> Dict:
+    """Parse one district workbook into DCB collection updates keyed by institution UUID"""
     try:
-        response = supabase.table("institutions").select("id").eq("ap_gazette_no", ap_gazette_no).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]["id"]
-        return None
-    except:
-        return None
-
-def process_excel_file(excel_file: Path) -> Dict:
-    district_name = DISTRICT_MAPPING.get(excel_file.stem)
-    if not district_name:
-        return {"status": "skipped"}
-
-    print(f"\n{'='*80}")
-    print(f"Processing: {excel_file.name} -> {district_name}")
-    print(f"{'='*80}")
-
-    try:
-        df = pd.read_excel(excel_file)
-        print(f"  [INFO] Found {len(df)} rows")
-
-        # Auto-detect columns
-        ap_no_col = None
-        c_arrears_col = None
-        c_current_col = None
-
-        for idx, col in enumerate(df.columns):
-            col_str = str(col).lower().strip()
-            if ap_no_col is None and any(kw in col_str for kw in ["ap", "gazette", "sl.no"]):
-                ap_no_col = idx
-            if ("c" in col_str or "collection" in col_str) and "arrear" in col_str:
-                c_arrears_col = idx
-            if ("c" in col_str or "collection" in col_str) and "current" in col_str:
-                c_current_col = idx
+        # Header first, so the data pass below only parses the columns it needs
+        xl = pd.ExcelFile(excel_file, engine=EXCEL_ENGINE)
+        columns = xl.parse(0, nrows=0).columns
+
+        # Auto-detect columns; headers are lowercased once, then matched column-wise
+        low = columns.astype(str).str.lower().str.strip()
+        ap_hits = np.flatnonzero(low.str.contains(r"ap|gazette|sl\.no"))
+        has_c = low.str.contains("c", regex=False)
+        arrear_hits = np.flatnonzero(has_c & low.str.contains("arrear", regex=False))
+        current_hits = np.flatnonzero(has_c & low.str.contains("current", regex=False))
+
+        # First AP-like column; for collections the last match wins
+        ap_no_col = int(ap_hits[0]) if len(ap_hits) else None
+        c_arrears_col = int(arrear_hits[-1]) if len(arrear_hits) else None
+        c_current_col = int(current_hits[-1]) if len(current_hits) else None
 
         # Default positions
-        if ap_no_col is None and len(df.columns) > 1:
+        if ap_no_col is None and len(columns) > 1:
             ap_no_col = 1
-        if c_arrears_col is None and len(df.columns) > 13:
+        if c_arrears_col is None and len(columns) > 13:
             c_arrears_col = 13
-        if c_current_col is None and len(df.columns) > 14:
+        if c_current_col is None and len(columns) > 14:
             c_current_col = 14
 
-        updated = 0
+        # header=None + skiprows keeps column labels equal to sheet positions; dtype=str skips type inference
+        used_cols = sorted({c for c in (ap_no_col, c_arrears_col, c_current_col) if c is not None})
+        with xl:
+            df = xl.parse(0, header=None, skiprows=1, usecols=used_cols, dtype=str)
+
+        # Latest row wins per institution, as with the old per-row UPDATEs
+        updates: Dict[str, Dict] = {}
         errors = []
 
-        for idx, row in df.iterrows():
+        def column(col: Optional[int]):
+            # Undetected columns read as blank cells
+            return df[col].to_numpy() if col is not None else [None] * len(df)
+
+        rows = zip(df.index, column(ap_no_col), column(c_arrears_col), column(c_current_col))
+        for idx, raw_ap_no, raw_arrears, raw_current in rows:
             try:
-                ap_no = clean_text(row.iloc[ap_no_col]) if ap_no_col is not None and ap_no_col < len(row) else None
+                ap_no = clean_text(raw_ap_no)
                 if not ap_no or ap_no.lower() in ["ap no", "gazette", "sl no"]:
                     continue
 
-                institution_id = get_institution_id(ap_no)
-                if not institution_id:
+                institution_id = _institution_ids.get(normalize_ap_no(ap_no))
+                # Only existing DCB records are updated, never created
+                if not institution_id or institution_id not in _dcb_inspectors:
                     continue
 
-                c_arrears = clean_numeric(row.iloc[c_arrears_col]) if c_arrears_col is not None and c_arrears_col < len(row) else 0.0
-                c_current = clean_numeric(row.iloc[c_current_col]) if c_current_col is not None and c_current_col < len(row) else 0.0
+                c_arrears = clean_numeric(raw_arrears)
+                c_current = clean_numeric(raw_current)
 
-                # Update DCB record
-                result = supabase.table("institution_dcb").update({
+                # inspector_id is NOT NULL, so it has to be sent even though it is unchanged
+                updates[institution_id] = {
+                    "institution_id": institution_id,
+                    "financial_year": FINANCIAL_YEAR,
+                    "inspector_id": _dcb_inspectors[institution_id],
                     "collection_arrears": c_arrears,
                     "collection_current": c_current,
-                }).eq("institution_id", institution_id).eq("financial_year", "2024-25").execute()
-
-                if result.data:
-                    updated += 1
+                }
 
             except Exception as e:
                 errors.append(f"Row {idx + 2}: {str(e)}")
 
-        print(f"  [SUMMARY] Updated {updated} DCB records, Errors: {len(errors)}")
-        return {"status": "success", "updated": updated, "errors": len(errors)}
+        return {"status": "success", "rows": len(df), "updates": updates, "errors": len(errors)}
 
     except Exception as e:
-        print(f"  [ERROR] {str(e)}")
         return {"status": "error", "error": str(e)}
 
 def main():
@@ -165,18 +188,57 @@ def main():
     if not excel_files:
         print(f"[ERROR] No Excel files found in {EXCEL_DIR}")
         sys.exit(1)
+    excel_files = [f for f in sorted(excel_files) if f.stem in DISTRICT_MAPPING]
+
+    institution_ids = load_institution_ids()
+    dcb_inspectors = load_dcb_inspectors(FINANCIAL_YEAR)
+    print(f"[INFO] Loaded {len(institution_ids)} institutions, {len(dcb_inspectors)} DCB records for {FINANCIAL_YEAR}")
 
+    # Parsing is CPU-bound pandas work, so fan the workbooks out across processes;
+    # the lookup maps are shipped to each worker once via the initializer
     results = []
-    for excel_file in sorted(excel_files):
-        result = process_excel_file(excel_file)
-        results.append(result)
+    if excel_files:
+        max_workers = min(len(excel_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_worker, initargs=(institution_ids, dcb_inspectors)
+        ) as executor:
+            results = list(executor.map(parse_excel_file, excel_files))
+
+    # Later files win for an institution that appears twice, as with the sequential loop
+    updates: Dict[str, Dict] = {}
+    for excel_file, result in zip(excel_files, results):
+        print(f"\n{'='*80}")
+        print(f"Processing: {excel_file.name} -> {DISTRICT_MAPPING[excel_file.stem]}")
+        print(f"{'='*80}")
+        if result["status"] == "error":
+            print(f"  [ERROR] {result['error']}")
+            continue
+        print(f"  [INFO] Found {result['rows']} rows")
+        print(f"  [SUMMARY] {len(result['updates'])} DCB records to update, Errors: {result['errors']}")
+        updates.update(result["updates"])
+
+    # Upserts are round-trip bound: keep several batches in flight on the shared client
+    payload = list(updates.values())
+    batches = [payload[i:i + UPSERT_BATCH_SIZE] for i in range(0, len(payload), UPSERT_BATCH_SIZE)]
+    total_updated = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as executor:
+        futures = [executor.submit(upsert_dcb_batch, batch) for batch in batches]
+        # A failed batch is reported and counted; the batches that did commit still add up
+        for start, batch, future in zip(range(0, len(payload), UPSERT_BATCH_SIZE), batches, futures):
+            try:
+                total_updated += future.result()
+            except Exception as e:
+                error_msg = f"Batch of {len(batch)} rows starting at {start}: {str(e)}"
+                errors.append(error_msg)
+                print(f"  [ERROR] {error_msg}")
 
-    total_updated = sum(r.get("updated", 0) for r in results if r.get("status") == "success")
     print(f"\n{'='*80}")
     print(f"TOTAL UPDATED: {total_updated} DCB records")
+    print(f"Failed batches: {len(errors)}")
     print(f"{'='*80}")
 
-    return 0
+    return 1 if errors else 0
 
 if __name__ == "__main__":
     sys.exit(main())
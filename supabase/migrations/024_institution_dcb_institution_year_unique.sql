@@ -0,0 +1,43 @@
+-- ============================================
+-- Unique (institution_id, financial_year) on institution_dcb
+-- Required for batched upserts from the Excel importers
+-- (PostgREST on_conflict=institution_id,financial_year)
+-- ============================================
+
+DO $$
+DECLARE
+  dup_sample text;
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint
+    WHERE conname IN (
+        'institution_dcb_institution_id_financial_year_key',
+        'institution_dcb_institution_year_unique'
+      )
+      AND conrelid = 'public.institution_dcb'::regclass
+  ) THEN
+    -- Existing duplicates would abort ADD CONSTRAINT with a bare unique violation.
+    -- These are financial records, so they are not deleted here: fail with the offending
+    -- keys instead, and let them be merged by hand before re-running.
+    SELECT string_agg(format('(%s, %s) x%s', institution_id, financial_year, n), ', '
+                      ORDER BY institution_id, financial_year)
+      INTO dup_sample
+    FROM (
+      SELECT institution_id, financial_year, count(*) AS n
+      FROM public.institution_dcb
+      WHERE financial_year IS NOT NULL
+      GROUP BY institution_id, financial_year
+      HAVING count(*) > 1
+      ORDER BY institution_id, financial_year
+      LIMIT 20
+    ) d;
+
+    IF dup_sample IS NOT NULL THEN
+      RAISE EXCEPTION 'institution_dcb has duplicate (institution_id, financial_year) rows; merge them before adding the unique constraint. First duplicates: %', dup_sample;
+    END IF;
+
+    ALTER TABLE public.institution_dcb
+      ADD CONSTRAINT institution_dcb_institution_year_unique
+      UNIQUE (institution_id, financial_year);
+  END IF;
+END $$;
@@ -0,0 +1,28 @@
+-- ============================================
+-- Default inspector_id on institution_dcb
+-- Fills inspector_id from the institution's district when an insert omits it,
+-- so importers can send DCB rows without resolving inspectors client-side
+-- (one inspector per district is enforced by unique_inspector_per_district_idx)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION public.set_institution_dcb_inspector()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.inspector_id IS NULL THEN
+    SELECT p.id INTO NEW.inspector_id
+    FROM public.institutions i
+    JOIN public.profiles p
+      ON p.district_id = i.district_id
+     AND p.role = 'inspector'
+    WHERE i.id = NEW.institution_id
+    LIMIT 1;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS set_institution_dcb_inspector ON public.institution_dcb;
+CREATE TRIGGER set_institution_dcb_inspector
+  BEFORE INSERT ON public.institution_dcb
+  FOR EACH ROW
+  EXECUTE FUNCTION public.set_institution_dcb_inspector();